@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+検索のベンチマーク（画面なし）。all_data.xlsx と同じ形の合成ブックを作り、
+search_core の読み込み・各検索を計測して JSON で出力する。版ごとの結果を比べて遅くなっていないかを見る用。
+
+    python bench_search.py                          # 1万件
+    python bench_search.py --rows 10000 100000 1000000 --out bench.json
+    python bench_search.py --workbook all_data.xlsx # 手元のブックをそのまま使う
+    python bench_search.py --normalize-rows 200000  # 正規化（normalize_series）の一致確認と計測の件数
+    python bench_search.py --no-peak-rss            # 読み込み方式ごとのピークメモリを計らない
+
+合成ブックは --workdir に件数・シードごとに保存し、次回からは作り直さない。
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import search_core as core
+
+# ========= 合成データ =========
+# 列は all_data.xlsx と同じ（資料シート SHEET_NAME ＋ 人名シート NAME_SHEET）
+BENCH_COLUMNS = ["No.", "登録番号", "メディア", "タイトル", "タイトル(カタカナ)", "作曲者", "演奏者",
+                 "演奏者（追加）", "演奏者(カタカナ)", "ジャンル", "レコード番号", "レーベル", "内容", "内容（追加）"]
+BENCH_SEED = 20240801
+
+# 漢字・かな・ローマ字の混ざった語彙（広島関係の語は一部の行にだけ入る）
+TITLE_WORDS = ["交響曲", "第5番", "運命", "協奏曲", "ピアノ", "ソナタ", "夜想曲", "組曲", "序曲", "幻想",
+               "春", "夏", "秋", "冬", "海", "山", "川", "星", "夢", "愛", "ふるさと", "さくら", "こもりうた",
+               "ジャズ", "ブルース", "ロック", "ワルツ", "マーチ", "Symphony", "Concerto", "Jazz", "Blues",
+               "Live", "Best", "Vol.1", "Vol.2", "ｸﾗｼｯｸ", "ﾍﾞｽﾄ", "全集", "名曲集", "入門", "物語"]
+HIROSHIMA_WORDS = ["広島", "ヒロシマ", "ひろしま", "ﾋﾛｼﾏ", "Hiroshima", "原爆ドーム", "平和記念公園",
+                   "宮島", "厳島", "呉", "尾道", "カープ", "被爆", "路面電車"]
+PEOPLE = ["ベートーヴェン", "モーツァルト", "バッハ", "ショパン", "ブラームス", "チャイコフスキー", "ドヴォルザーク",
+          "カラヤン", "バーンスタイン", "小澤征爾", "朝比奈隆", "岩城宏之", "美空ひばり", "坂本九", "さだまさし",
+          "山田耕筰", "滝廉太郎", "武満徹", "Miles Davis", "John Coltrane", "Bill Evans", "The Beatles",
+          "Queen", "ABBA", "ｶﾗﾔﾝ", "ばっは", "ぐるーぷ あい", "123 Band", "4 Seasons"]
+MEDIA = ["ビデオテープ", "DVD", "レコード", "コンパクトカセットテープ", "CD"]
+LABELS = ["Sony", "EMI", "DG", "Decca", "Philips", "日本コロムビア", "キングレコード", "ビクター", ""]
+CONTENT_WORDS = ["解説", "収録", "演奏", "指揮", "管弦楽団", "合唱", "独唱", "録音", "ライブ", "初演", "編曲",
+                 "映像", "記録", "朗読", "効果音", "民謡", "童謡", "唱歌", "Orchestra", "Choir", "Remaster",
+                 "ステレオ", "モノラル", "ﾓﾉﾗﾙ", "字幕", "日本語", "英語"]
+HIROSHIMA_RATE = 0.05  # 広島関係の語を含む行の割合
+
+def _genres() -> list:
+    return sorted({g for subs in core.GENRE_GROUPS.values() for g in subs})
+
+def _to_katakana(s: str) -> str:
+    return "".join(chr(ord(ch) + 0x60) if "ぁ" <= ch <= "ゖ" else ch for ch in s)
+
+def make_rows(n: int, seed: int = BENCH_SEED):
+    """合成の資料を1行ずつ返す（BENCH_COLUMNS の順の値リスト）。同じ n・seed なら同じ内容。"""
+    rnd = random.Random(seed)
+    genres = _genres()
+    for i in range(n):
+        words = rnd.sample(TITLE_WORDS, rnd.randint(2, 4))
+        content = rnd.sample(CONTENT_WORDS, rnd.randint(3, 8))
+        if rnd.random() < HIROSHIMA_RATE:
+            (words if rnd.random() < 0.5 else content).append(rnd.choice(HIROSHIMA_WORDS))
+        title = " ".join(words)
+        composer = rnd.choice(PEOPLE)
+        performer = rnd.choice(PEOPLE)
+        extra = rnd.choice(PEOPLE) if rnd.random() < 0.3 else None
+        yield [
+            i + 1,
+            f"A{i:07d}",
+            rnd.choice(MEDIA),
+            title,
+            _to_katakana(title),
+            composer,
+            performer,
+            extra,
+            _to_katakana(performer),
+            rnd.choice(genres),
+            f"{rnd.choice('ABCDKLSX')}-{rnd.randint(1, 99999)}" if rnd.random() < 0.7 else None,
+            rnd.choice(LABELS) or None,
+            "、".join(content),
+            "　".join(rnd.sample(CONTENT_WORDS, 2)) if rnd.random() < 0.2 else None,
+        ]
+
+def write_workbook(path: Path, n: int, seed: int = BENCH_SEED):
+    """all_data.xlsx と同じ形の合成ブックを書き出す（openpyxl の write_only で1行ずつ）。"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(core.SHEET_NAME)
+    ws.append(BENCH_COLUMNS)
+    for row in make_rows(n, seed):
+        ws.append(row)
+    names = wb.create_sheet(core.NAME_SHEET)
+    for nm in PEOPLE:
+        names.append([nm])
+    tmp = path.with_name(path.name + ".tmp")
+    wb.save(tmp)
+    tmp.replace(path)
+
+def synthetic_workbook(workdir: Path, n: int, seed: int = BENCH_SEED) -> Path:
+    path = workdir / f"bench_{n}_{seed}.xlsx"
+    if not path.exists():
+        write_workbook(path, n, seed)
+    return path
+
+# ========= 計測 =========
+def _timed(fn, repeat: int, setup=None) -> dict:
+    """fn を repeat 回実行した時間（ミリ秒）。setup は毎回の計測前に呼ぶ（時間に含めない）。"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    times.sort()
+    stats = {
+        "n": len(times),
+        "min_ms": round(times[0], 3),
+        "median_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        "max_ms": round(times[-1], 3),
+    }
+    if isinstance(result, (np.ndarray, list, range)):
+        stats["hits"] = len(result)
+    return stats
+
+BENCH_QUERIES = ["交響曲", "ベートーヴェン", "ｶﾗﾔﾝ", "jazz", "ピアノ ソナタ", "Symphony Live", "ふるさと",
+                 "管弦楽団 録音 ステレオ", "A00012", "存在しない語"]
+BENCH_ADVANCED = [
+    ({"タイトル": "交響曲"}, []),
+    ({"人名": "カラヤン"}, ["DVD", "レコード"]),
+    ({"タイトル": "ソナタ", "内容": "録音"}, []),
+    ({}, ["ビデオテープ"]),
+]
+
+def check_rank_order(engine, queries=BENCH_QUERIES, page: int = 10) -> dict:
+    """
+    関連度順（RankedRows）をページ送りで取り出した順が、全件を (-スコア, 行順) で並べ替えた順と
+    同じかを確かめる（先頭から順に・最後のページから先に、の2通り）。違えば AssertionError。
+    """
+    checked = 0
+    for q in queries:
+        rows = engine.search(q)
+        if not core.split_query(q) or len(rows) == 0:
+            continue
+        scores = engine.ranker.scores(engine.df, engine.index, q, rows)
+        full = rows[np.lexsort((rows, -scores))]
+        forward = core.RankedRows(rows, scores, first=page)
+        paged = np.concatenate([forward[i:i + page] for i in range(0, len(rows), page)])
+        assert np.array_equal(paged, full), f"関連度順がページ送りで変わる: {q}"
+        backward = core.RankedRows(rows, scores, first=page)
+        last = (len(rows) - 1) // page * page
+        tail = backward[last:]
+        assert np.array_equal(tail, full[last:]), f"関連度順が最後のページから見ると変わる: {q}"
+        assert np.array_equal(backward[0:len(rows)], full), f"関連度順が最後のページから見ると変わる: {q}"
+        checked += 1
+    return {"queries": checked, "ok": True}
+
+# 正規化の一致確認に混ぜる値（全角スペース区切り・半角カナ・NUL 入り・空文字）
+NORMALIZE_EDGE_CASES = ["", "　", "ＡＢＣ　ｶﾗﾔﾝ　ﾍﾞｰﾄｰｳﾞｪﾝ", "Ⅻ ㍻ ｷﾞｬﾗﾘｰ", "a\x00ＢＣ", "ヴァイオリン\u3000ヰ"]
+
+def check_normalize(n: int, repeat: int, seed: int = BENCH_SEED) -> dict:
+    """
+    normalize_series（列版）の結果が各行に normalize_text を適用したものと同じかを確かめ、両方の時間を計る。
+    対象は合成の資料 n 件の全文（列を全角スペースで連結。読み込み時の __norm__ の元と同じ形）。違えば AssertionError。
+    """
+    texts = ["　".join("" if v is None else str(v) for v in row) for row in make_rows(n, seed)]
+    ser = pd.Series(texts + NORMALIZE_EDGE_CASES)
+    expected = [core.normalize_text(t) for t in ser]
+    got = core.normalize_series(ser).tolist()
+    bad = next((i for i, (a, b) in enumerate(zip(got, expected)) if a != b), None)
+    assert len(got) == len(expected) and bad is None, f"normalize_series が normalize_text と違う: {ser[bad]!r}"
+    return {
+        "rows": len(ser),
+        "ok": True,
+        "normalize_series": _timed(lambda: core.normalize_series(ser), repeat),
+        "normalize_text.each": _timed(lambda: [core.normalize_text(t) for t in ser], repeat),
+    }
+
+def _peak_rss_mb():
+    """
+    このプロセスのピーク常駐メモリ（MB）。計れない環境では None。
+    Linux は /proc の VmHWM（ru_maxrss は親プロセスの値を引き継ぐことがあるので使わない）、
+    Windows は psutil の peak_wset、その他は ru_maxrss。
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)  # KB
+    except Exception:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        if hasattr(info, "peak_wset"):
+            return round(info.peak_wset / (1024 * 1024), 1)
+    except Exception:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # macOS はバイト、他は KB
+    except Exception:
+        return None
+
+def _peak_rss_child(path: str, mode: str):
+    # 子プロセス側：import 直後と build_dataset 後のピークを JSON で標準出力へ
+    core.LOAD_MODE = mode
+    base = _peak_rss_mb()
+    t0 = time.perf_counter()
+    df, _, _, _ = core.build_dataset(Path(path), mode=mode)
+    print(json.dumps({"rows": len(df), "load_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+                      "base_mb": base, "peak_mb": _peak_rss_mb()}))
+
+def peak_rss(path: Path, modes=("pandas", "stream")) -> dict:
+    """
+    読み込み方式（LOAD_MODE）ごとのピークメモリ。方式ごとに新しいプロセスで build_dataset を1回だけ行う
+    （ピークはプロセスの生涯で最大の値なので、同じプロセスでは比べられない）。
+    base_mb は import 直後、peak_mb は読み込み後のピーク、delta_mb はその差。
+    """
+    out = {}
+    for mode in modes:
+        code = f"import bench_search; bench_search._peak_rss_child({str(path)!r}, {mode!r})"
+        proc = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parent,
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            out[mode] = {"error": (proc.stderr.strip().splitlines() or [""])[-1]}
+            continue
+        res = json.loads(proc.stdout.strip().splitlines()[-1])
+        if res["base_mb"] is not None and res["peak_mb"] is not None:
+            res["delta_mb"] = round(res["peak_mb"] - res["base_mb"], 1)
+        out[mode] = res
+    return out
+
+def run_scenarios(path: Path, repeat: int) -> dict:
+    """1冊分のシナリオ。各検索は結果キャッシュを空にしてから計る（同じ語の再検索は別に計る）。"""
+    out = {}
+    out["load_dataset.cold"] = _timed(lambda: core.load_dataset(path, use_cache=False), 1)
+    core.load_dataset(path)  # キャッシュを作っておく
+    out["load_dataset.cached"] = _timed(lambda: core.load_dataset(path), repeat)
+    engine = core.SearchEngine.load(path)
+    clear = engine.cache.clear
+
+    for q in BENCH_QUERIES:
+        out[f"keyword_mask[{q}]"] = _timed(lambda q=q: engine.search(q), repeat, clear)
+    q = BENCH_QUERIES[0]
+    out[f"keyword_mask.cached[{q}]"] = _timed(lambda: engine.search(q), repeat)
+    rows = engine.search(q)
+    out["rank.order_check"] = check_rank_order(engine)
+    out[f"rank.first_page[{q}]"] = _timed(lambda: engine.fetch_page(engine.rank(q, rows), 0, 10), repeat)
+    # 入力しながら検索：1文字ずつ増える語を、直前の結果の絞り込みで
+    def typing(word="ベートーヴェン"):
+        prev = None
+        for k in range(1, len(word) + 1):
+            prev = engine.search(word[:k], within=prev)
+        return prev
+    out["keyword_mask.typing"] = _timed(typing, repeat, clear)
+
+    out["search_hiroshima"] = _timed(lambda: engine.facet("hiroshima"), repeat, clear)
+    for g in ["交響曲", "ロック", "その他"]:
+        out[f"search_by_genre[{g}]"] = _timed(lambda g=g: engine.facet("genre", g), repeat, clear)
+    for conds, media in BENCH_ADVANCED:
+        label = ",".join(f"{f}={v}" for f, v in conds.items()) + (("|" + "+".join(media)) if media else "")
+        out[f"run_advanced_search[{label}]"] = _timed(lambda c=conds, m=media: engine.advanced(c, m), repeat, clear)
+
+    # 人名検索ダイアログ：全行・全段・英字の一覧を作って件数を付ける（fill_names 相当）＋ 1人を選んで検索
+    def name_dialog():
+        shown = 0
+        for row, cols in core.GOJUON_ROWS.items():
+            for syl in [None] + cols:
+                items = engine.name_index["kana"].get(row, {}).get(syl, [])
+                shown += len([f"{nm}　（{engine.name_count(nm)}）" for nm in items])
+        for key in core.ALPHA_KEYS:
+            items = engine.name_index["alpha"].get(key, [])
+            shown += len([f"{nm}　（{engine.name_count(nm)}）" for nm in items])
+        return range(shown)
+    out["name_dialog.filters"] = _timed(name_dialog, repeat)
+    out["name_dialog.pick"] = _timed(lambda: engine.facet("name", PEOPLE[0]), repeat, clear)
+    out["fetch_record"] = _timed(lambda: [engine.fetch_record(r) for r in rows[:100]], repeat)
+    out["_dataset"] = {"rows": len(engine), "bytes_per_record": engine.bytes_per_record}
+    return out
+
+def _git_version() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=Path(__file__).resolve().parent,
+                              capture_output=True, text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ""
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="search_core のベンチマーク（結果は JSON）")
+    ap.add_argument("--rows", type=int, nargs="+", default=[10000], help="合成ブックの件数（複数可）")
+    ap.add_argument("--workbook", type=Path, help="合成せずにこのブックを計測する")
+    ap.add_argument("--repeat", type=int, default=5, help="各シナリオの繰り返し回数")
+    ap.add_argument("--seed", type=int, default=BENCH_SEED)
+    ap.add_argument("--mode", choices=["pandas", "stream"], default=core.LOAD_MODE, help="読み込み方式（LOAD_MODE）")
+    ap.add_argument("--workdir", type=Path, default=Path(tempfile.gettempdir()) / "search_bench",
+                    help="合成ブックの保存先")
+    ap.add_argument("--peak-rss", action=argparse.BooleanOptionalAction, default=True,
+                    help="読み込み方式（pandas / stream）ごとのピークメモリを別プロセスで計る")
+    ap.add_argument("--normalize-rows", type=int, default=200000,
+                    help="正規化の一致確認・計測に使う合成の件数（0 で行わない）")
+    ap.add_argument("--out", type=Path, help="JSON の書き出し先（省略時は標準出力）")
+    args = ap.parse_args(argv)
+
+    core.LOAD_MODE = args.mode
+    report = {
+        "version": _git_version(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "load_mode": args.mode,
+        "repeat": args.repeat,
+        "runs": [],
+    }
+    if args.workbook:
+        books = [args.workbook]
+    else:
+        args.workdir.mkdir(parents=True, exist_ok=True)
+        books = []
+        for n in args.rows:
+            print(f"合成ブック: {n} 件", file=sys.stderr)
+            books.append(synthetic_workbook(args.workdir, n, args.seed))
+    for path in books:
+        print(f"計測中: {path.name}", file=sys.stderr)
+        run = {"workbook": path.name, "scenarios": run_scenarios(path, args.repeat)}
+        if args.peak_rss:
+            run["peak_rss"] = peak_rss(path)
+        report["runs"].append(run)
+    if args.normalize_rows > 0:
+        print(f"正規化: {args.normalize_rows} 件", file=sys.stderr)
+        report["normalize"] = check_normalize(args.normalize_rows, args.repeat, args.seed)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
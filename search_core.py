@@ -0,0 +1,1479 @@
+# -*- coding: utf-8 -*-
+"""
+検索エンジン（Tk を使わない部分）。tkinter_0.1.py / tkinter_1.1.py / tkinter_1.2.py から共通で使う。
+読み込み（Excel → 検索用データ・キャッシュ）と検索（キーワード・ジャンル・広島関係・人名・詳細検索）、
+一覧・詳細の値の取り出しをまとめてあるので、画面なしで計測・ベンチマークできる。
+
+    engine = SearchEngine.load(Path("all_data.xlsx"))
+    rows = engine.search("交響曲 ベートーヴェン")      # 行位置（昇順）
+    page = engine.fetch_page(engine.rank("交響曲", rows), 0, 10)
+    rec = engine.fetch_record(rows[0])
+"""
+
+import pandas as pd
+import numpy as np
+import re
+import os
+import pickle
+import hashlib
+import threading
+import queue
+import time
+import json
+from collections import OrderedDict, deque
+import unicodedata
+from pathlib import Path
+
+try:
+    import pyarrow  # noqa: F401  省メモリ表現（COMPACT_DTYPES）で文字列列を Arrow で持つ
+    ARROW_OK = True
+except Exception:
+    ARROW_OK = False
+
+# ========= 設定 =========
+SHEET_NAME = "Sheet"
+NAME_SHEET = "Name"  # 人名一覧（1列目のみ使用）
+# 読み込み方式： "pandas" = pd.read_excel（従来どおり） / "stream" = openpyxl で1行ずつ（省メモリ）
+LOAD_MODE  = "pandas"
+STREAM_CHUNK_ROWS = 5000  # "stream" で列・検索用の列をまとめて作る行数（Python の文字列はこの行数分だけ持つ）
+
+# 列の使い道（スキーマ）
+MAIN_COLS     = ["登録番号","メディア","タイトル","演奏者","作曲者","ジャンル"]  # 一覧表示（無ければ先頭6列）
+DETAIL_FIELDS = ["作曲者","演奏者","ジャンル","メディア","登録番号","レコード番号","レーベル","内容"]  # 詳細表示（タイトルは見出し）
+# キーワード検索（__全文__）の対象列。None = シートのすべての列を読み込んで対象にする。
+# 列名のリストにすると、ここと一覧・詳細・ジャンル・詳細検索で使う列だけを読み込み、
+# それ以外の列（管理用の列など）は読み込まない
+# （一覧・検索の列は画面ごとに SearchEngine.load(main_cols=..., search_cols=...) でも指定できる）
+SEARCH_COLS   = None
+
+# 省メモリ表現（長時間動かす端末向け・任意）
+# True: 空欄は "nan" ではなく空文字、値の種類が少ない列はカテゴリ型、その他の文字列列は
+#       Arrow 文字列（pyarrow が入っていれば）で持つ。読み込み後に1件あたりのメモリ量を表示する
+COMPACT_DTYPES = False
+COMPACT_CATEGORY_COLS = ["メディア", "ジャンル", "レーベル", "作曲者"]
+
+# 読み込み済みデータのキャッシュ（all_data.xlsx と同じフォルダに保存）
+CACHE_VERSION = 16            # キャッシュ形式を変えたら上げる（古いキャッシュは自動で作り直し）
+CACHE_SUFFIX  = ".cache.pkl"  # all_data.xlsx -> all_data.xlsx.<スキーマの要約>.cache.pkl（画面の列の指定ごとに別ファイル）
+
+VERIFY_CHUNK = 4096  # 部分一致の確認をこの行数ごとに区切る（途中で打ち切れるように）
+
+# キーワード検索の結果を関連度順（BM25F 風）に並べる。False なら Excel の行順
+RANK_RESULTS = True
+RANK_FIELD_WEIGHTS = {"タイトル": 3.0, "人名": 2.0, "内容": 1.0}  # 欄ごとの重み（内容＝全文）
+RANK_TOPK = 50  # 最初に並べる上位件数（以降はページを進めたときに必要な分だけ並べる）
+
+QUERY_CACHE_SIZE = 64  # 検索結果（行位置）を覚えておく件数。同じボタン・同じ語の再検索は計算しない
+
+# 処理時間の計測（検索・一覧表示・詳細表示など。スタッフ用の統計表示と記録ファイルに使う）
+METRICS = True        # False なら計測しない（計測箇所は何もしない処理になる）
+METRICS_WINDOW = 500  # 処理ごとに直近この回数分から p50 / p95 / p99 を出す
+
+# 検索ログ（QueryLog。JSON Lines で追記し、大きくなったら .1 .2 … へ回す）
+QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024  # 1ファイルの上限（超える前に回す）
+QUERY_LOG_BACKUPS = 3                  # 残す古いファイルの数（.1 が一番新しい）
+QUERY_LOG_FLUSH_MS = 2000              # 書き込みスレッドがまとめて書く間隔（ミリ秒）
+QUERY_LOG_BATCH = 500                  # 1回にまとめて書く最大件数
+
+# 詳細検索：欄ごとの対象列（列名にこれらの語を含む列をまとめて1つの検索欄にする）
+ADV_PERSON_KEYS = ["演奏","作曲","出演","監督","人名","作者","著者","制作","製作","歌手","語り"]
+ADV_CALLNO_KEYS = ["請求","資料番号","所蔵番号","管理番号","ID","番号"]
+ADV_MEDIA_KEYS  = ["メディア","媒体","種類","フォーマット","形態"]
+# 欄 → 読み込み時に作る正規化済みの連結列（「内容」は全文の __norm__ をそのまま使う）
+ADV_FIELD_COLS = {
+    "タイトル": "__タイトル__",
+    "人名": "__人名__",
+    "内容": "__norm__",
+    "請求番号": "__請求番号__",
+}
+# 詳細検索のメディア種別（チェックボックス）
+ADV_MEDIA_ITEMS = ["ビデオテープ", "DVD", "レコード", "コンパクトカセットテープ"]
+
+# ジャンル検索ダイアログの分類（親 → ボタン。ボタン名を『ジャンル』列に部分一致で探す）
+GENRE_GROUPS = {
+    "クラシック": ["交響曲","管弦楽曲","協奏曲","室内楽曲","独奏曲","歌劇","声楽曲","宗教曲","現代音楽","その他"],
+    "ポピュラー": ["ヴォーカル, フォーク","ソウル, ブルース","ジャズ, ジャズ・ボーカル","ロック",
+                  "シャンソン, カンツォーネ","ムード","ラテン","カントリー&ウェスタン, ハワイアン",
+                  "歌謡曲, 日本のポピュラーソング","その他"],
+    "その他の音楽": ["邦楽","日本民謡","唱歌など","外国民謡など","体育など","広島県関連"],
+    "音楽以外": ["園芸","文芸","演劇","語学","記録","効果音","その他"],
+    "児童": ["児童音楽","児童文芸"]
+}
+# 値の種類が少なくカテゴリ型で持つ列
+CATEGORY_COLS = ["ジャンル", "メディア"]
+
+# --- ひろしま表記ゆれ & 関連語対応 ---
+HIROSHIMA_BASE_TERMS = [
+    "広島","ヒロシマ","ひろしま","廣島","ﾋﾛｼﾏ","hiroshima","HIROSHIMA"
+]
+HIROSHIMA_RELATED_TERMS = [
+    # 地名・施設
+    "平和記念公園","平和公園","原爆ドーム","原爆資料館","宮島","厳島","嚴島","厳島神社",
+    "呉","呉市","江田島","似島","福山","尾道","三次","東広島","安芸","安芸郡","可部","己斐",
+    "紙屋町","八丁堀","広電","路面電車",
+    # 野球・文化
+    "カープ","広島東洋カープ",
+    # 用語
+    "原爆","被爆","被曝","原子爆弾","核兵器",
+]
+
+# カタカナ → ひらがな変換表（Unicode範囲変換：Katakana small a ... ke）
+_KATA_TO_HIRA = {cp: cp - 0x60 for cp in range(0x30A1, 0x30F7)}
+
+def _to_hiragana(s: str) -> str:
+    # カタカナ → ひらがな変換（Unicode範囲変換）
+    return s.translate(_KATA_TO_HIRA)
+
+def normalize_text(text: str) -> str:
+    # 全角/半角正規化 → 小文字 → ひらがな化
+    t = unicodedata.normalize("NFKC", str(text or ""))
+    t = t.lower()
+    t = _to_hiragana(t)
+    return t
+
+def _to_hiragana_block(s: str) -> str:
+    # 長い文字列をまとめてひらがな化（コードポイント配列を NumPy で一括シフト）
+    cps = np.frombuffer(s.encode("utf-32-le", "surrogatepass"), dtype=np.uint32).copy()
+    cps[(cps >= 0x30A1) & (cps <= 0x30F6)] -= 0x60
+    return cps.tobytes().decode("utf-32-le", "surrogatepass")
+
+def normalize_series(ser: pd.Series, chunk: int = 20000) -> pd.Series:
+    """
+    normalize_text の列版（結果は各行に normalize_text を適用したものと同じ）。
+    - 全角スペース（__全文__ の区切り）は先に半角へ。NFKC の「正規化済み」高速判定を通る行が大半になる
+    - 小文字化・ひらがな化は chunk 行ずつ NUL 区切りで連結して一括で行う
+    """
+    texts = ser.fillna("").astype(str).tolist()
+    out = []
+    for i in range(0, len(texts), chunk):
+        part = texts[i:i + chunk]
+        block = "\x00".join(unicodedata.normalize("NFKC", t.replace("\u3000", " ")) for t in part)
+        res = _to_hiragana_block(block.lower()).split("\x00")
+        if len(res) != len(part):  # 値に NUL が含まれていた場合だけ1行ずつ
+            res = [normalize_text(t) for t in part]
+        out.extend(res)
+    return pd.Series(out, index=ser.index)
+
+class AhoCorasick:
+    """
+    複数語の同時部分一致（Aho–Corasick）。
+    失敗遷移をたどった先まで展開した遷移表（DFA）にしておき、1文字1回の辞書引きで走査する。
+    """
+    def __init__(self, words):
+        self.words = tuple(w for w in words if w)  # 探す語（キャッシュの照合にも使う）
+        goto = [{}]
+        out = [False]
+        for w in self.words:
+            st = 0
+            for ch in w:
+                nxt = goto[st].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[st][ch] = nxt
+                    goto.append({})
+                    out.append(False)
+                st = nxt
+            out[st] = True
+        # 幅優先で失敗遷移を求めつつ遷移表を完成させる（根の子の失敗先は根）
+        delta = [dict(g) for g in goto]
+        fail = [0] * len(goto)
+        pending = list(goto[0].values())
+        for st in pending:
+            f = fail[st]
+            out[st] = out[st] or out[f]
+            for ch, nxt in delta[f].items():
+                delta[st].setdefault(ch, nxt)
+            for ch, nxt in goto[st].items():
+                fail[nxt] = delta[f].get(ch, 0)
+                pending.append(nxt)
+        self._delta = delta
+        self._out = out
+
+    def search(self, text: str) -> bool:
+        """text にいずれかの語が含まれていれば True。"""
+        delta, out = self._delta, self._out
+        st = 0
+        for ch in text:
+            st = delta[st].get(ch, 0)
+            if out[st]:
+                return True
+        return False
+
+# 正規化済みキーワード集合（正規化しておく）
+_HIRO_WORDS = [normalize_text(w) for w in (HIROSHIMA_BASE_TERMS + HIROSHIMA_RELATED_TERMS)]
+# すべての語を1回の走査で探すオートマトン（__norm__ に対して使う）
+HIROSHIMA_MATCHER = AhoCorasick(_HIRO_WORDS)
+
+def hiroshima_mask(norm_texts) -> np.ndarray:
+    return np.fromiter((HIROSHIMA_MATCHER.search(t) for t in norm_texts),
+                       dtype=bool, count=len(norm_texts))
+
+# ========= ユーティリティ =========
+def katakana_to_hiragana(s: str) -> str:
+    # カタカナ -> ひらがな（半角->全角も正規化）
+    if not s:
+        return s
+    s = unicodedata.normalize('NFKC', s)
+    return s.translate(_KATA_TO_HIRA)
+
+# 濁点・半濁点を除いた「行判定用」の基底かなに変換
+DAKUTEN_MAP = str.maketrans({
+    "が":"か","ぎ":"き","ぐ":"く","げ":"け","ご":"こ",
+    "ざ":"さ","じ":"し","ず":"す","ぜ":"せ","ぞ":"そ",
+    "だ":"た","ぢ":"ち","づ":"つ","で":"て","ど":"と",
+    "ば":"は","び":"ひ","ぶ":"ぶ","べ":"へ","ぼ":"ほ",
+    "ぱ":"は","ぴ":"ひ","ぷ":"ふ","ぺ":"へ","ぽ":"ほ",
+    "ゔ":"う",
+    # 小書き文字 -> 基本音
+    "ぁ":"あ","ぃ":"い","ぅ":"う","ぇ":"え","ぉ":"お",
+    "ゃ":"や","ゅ":"ゆ","ょ":"よ","っ":"つ",
+})
+
+GOJUON_ROWS = {
+    "あ": ["あ","い","う","え","お"],
+    "か": ["か","き","く","け","こ"],
+    "さ": ["さ","し","す","せ","そ"],
+    "た": ["た","ち","つ","て","と"],
+    "な": ["な","に","ぬ","ね","の"],
+    "は": ["は","ひ","ふ","へ","ほ"],
+    "ま": ["ま","み","む","め","も"],
+    "や": ["や","ゆ","よ"],
+    "ら": ["ら","り","る","れ","ろ"],
+    "わ": ["わ","を","ん"],
+}
+
+PRIMARY_KANA = ["あ","か","さ","た","な","は","ま","や","ら","わ"]
+
+def name_initial_category(name: str):
+    """
+    先頭の可視文字からカテゴリを決める。
+    - ひらがな/カタカナ -> 五十音の行 + 段（例：'か'行 'き'段）
+    - 英数字 -> 'A'〜'Z' or '0-9'
+    - その他（漢字等）は分類不能なので None を返す（かなフィルタでは除外）
+    """
+    if not name:
+        return None, None
+    s = name.strip()
+    if not s:
+        return None, None
+    ch = s[0]
+    # 正規化（半角->全角、カタカナ->ひらがな）
+    ch_norm = katakana_to_hiragana(ch)
+    # ひらがな
+    if "ぁ" <= ch_norm <= "ん":
+        base = ch_norm.translate(DAKUTEN_MAP)
+        # 行
+        for row, cols in GOJUON_ROWS.items():
+            if base[0] in cols:
+                return ("kana", row, base[0])
+        return ("kana", None, base[0])
+    # 英字/数字
+    ch_nfkc = unicodedata.normalize("NFKC", ch)
+    if ch_nfkc.isalpha():
+        return ("alpha", ch_nfkc.upper(), None)
+    if ch_nfkc.isdigit():
+        return ("digit", "0-9", None)
+    return (None, None, None)
+
+ALPHA_KEYS = ["0-9"] + [chr(ord('A')+i) for i in range(26)]
+
+def build_name_index(names) -> dict:
+    """
+    人名検索ダイアログの頭文字索引（読み込み時に1回だけ作る）。
+      kana[行][段]   … その段で始まる人名（重複なし・並べ替え済み）。段 None は行全体
+      alpha[A〜Z / 0-9] … 英字（大文字小文字を区別せず並べ替え）・数字で始まる人名
+    """
+    kana = {r: {} for r in GOJUON_ROWS}
+    alpha = {k: set() for k in ALPHA_KEYS}
+    for nm in set(names):
+        s = nm.strip()
+        if not s:
+            continue
+        cat, row, col = name_initial_category(s)
+        if cat == "kana" and row is not None:
+            kana[row].setdefault(None, set()).add(nm)
+            kana[row].setdefault(col, set()).add(nm)
+        ch = unicodedata.normalize("NFKC", s[0])
+        if ch.isdigit():
+            alpha["0-9"].add(nm)
+        elif ch.isalpha() and ch.upper() in alpha:
+            alpha[ch.upper()].add(nm)
+    return {
+        "kana": {r: {c: sorted(v) for c, v in d.items()} for r, d in kana.items()},
+        "alpha": {k: sorted(sorted(v), key=lambda x: x.upper()) for k, v in alpha.items()},
+    }
+
+# ========= キャッシュ =========
+def _cache_path(path: Path, schema) -> Path:
+    # スキーマ（schema_key）ごとに別のファイル。列の指定が違う画面どうしで互いに上書きしない
+    tag = hashlib.sha1(repr(schema).encode("utf-8")).hexdigest()[:12]
+    return path.with_name(f"{path.name}.{tag}{CACHE_SUFFIX}")
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_cache(path: Path, schema):
+    """
+    ブックとスキーマ（schema_key）に対応するキャッシュを読み込む。
+    ファイルの先頭は小さな見出し（形式・スキーマ・ブックのサイズ/更新日時/ハッシュ）で、
+    それが合ったときだけ続きの本体を読み込む（古いキャッシュの本体は読まずに済む）。
+    - サイズ + 更新日時が一致すればそのまま使う
+    - 更新日時だけ違う（コピー・上書き保存し直し等）場合は内容ハッシュで同一性を確認
+    - 形式違い・破損・ブック更新時は None（呼び出し側で作り直す）
+    """
+    try:
+        st = path.stat()
+        with open(_cache_path(path, schema), "rb") as f:
+            head = pickle.load(f)
+            if (not isinstance(head, dict) or head.get("version") != CACHE_VERSION
+                    or head.get("schema") != schema or head.get("size") != st.st_size):
+                return None
+            touched = head.get("mtime_ns") != st.st_mtime_ns
+            if touched and head.get("sha1") != _file_digest(path):
+                return None
+            payload = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    if touched:
+        # 内容は同じなので、次回はハッシュ計算なしで当たるよう更新日時を書き戻す
+        save_cache(path, payload, schema, st, head.get("sha1"))
+    return payload
+
+def save_cache(path: Path, payload: dict, schema, st: os.stat_result = None, sha1: str = None):
+    """キャッシュを書き出す（見出し→本体の順。一時ファイル→置き換え）。書けない環境では黙って諦める。"""
+    cache = _cache_path(path, schema)
+    tmp = cache.with_name(cache.name + ".tmp")
+    try:
+        if st is None:
+            st = path.stat()
+        head = {
+            "version": CACHE_VERSION,
+            "schema": schema,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha1": sha1 or _file_digest(path),
+        }
+        with open(tmp, "wb") as f:
+            pickle.dump(head, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache)
+    except Exception:
+        try:
+            tmp.unlink()
+        except Exception:
+            pass
+        return
+    try:
+        # スキーマごとに分ける前の1ファイルのキャッシュは使われないので消す
+        path.with_name(path.name + CACHE_SUFFIX).unlink()
+    except Exception:
+        pass
+
+# ========= 検索インデックス =========
+_EMPTY_ROWS = np.zeros(0, dtype=np.int32)
+
+def _codepoints(s: str) -> np.ndarray:
+    return np.frombuffer(s.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+
+class NgramIndex:
+    """
+    文字 1〜3-gram の転置インデックス（小文字化した全文が対象）。
+    - 各 gram → その gram を含む行位置（昇順・重複なし）
+    - 3文字以下の語はその gram の posting がそのまま一致行
+    - 4文字以上の語はすべての 3-gram を含む行が候補（posting の積集合）。
+      候補行だけ部分一致で確認する（keyword_rows 側）
+    作成は CHUNK_ROWS 行ずつ：チャンクごとに (gram, 行) の組を作って重複を除き、最後に gram ごとの
+    posting へ行順に書き込む。全文ぶんの gram キーを一度に持たないので、作成中のメモリは全文の大きさに比例しない。
+    """
+    N = 3
+    CHUNK_ROWS = 20000
+
+    def __init__(self, texts):
+        texts = [str(t).lower() for t in texts]
+        n = len(texts)
+        self.size = n
+        self.alphabet = np.zeros(0, dtype=np.uint32)
+        self.grams = np.zeros(0, dtype=np.uint64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = _EMPTY_ROWS
+        if n == 0:
+            return
+        starts = range(0, n, self.CHUNK_ROWS)
+        # 文字 → 1 始まりの連番ID（0 は区切り。gram キーを小さく保つ）。全チャンク共通
+        alphabet = np.unique(np.concatenate(
+            [np.unique(_codepoints("\x00".join(texts[s:s + self.CHUNK_ROWS]))) for s in starts]))
+        alphabet = alphabet[alphabet != 0]
+        if len(alphabet) == 0:
+            return
+        # チャンクごとの (gram キー一覧, 組ごとの gram 番号, 組ごとの行位置)
+        parts = [self._chunk_pairs(texts[s:s + self.CHUNK_ROWS], s, alphabet) for s in starts]
+        del texts
+        grams = np.unique(np.concatenate([keys for keys, _, _ in parts]))
+        # gram ごとの行数 → posting の区切り
+        counts = np.zeros(len(grams), dtype=np.int64)
+        gids = []
+        for keys, gidx, _ in parts:
+            gid = np.searchsorted(grams, keys)
+            counts[gid] += np.bincount(gidx, minlength=len(keys))
+            gids.append(gid)
+        offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        # チャンクは行順なので、前から書き込めば各 posting は昇順になる
+        postings = np.empty(int(offsets[-1]), dtype=np.int32)
+        cursor = offsets[:-1].copy()
+        for (keys, gidx, rows), gid in zip(parts, gids):
+            local = np.bincount(gidx, minlength=len(keys))
+            first = np.zeros(len(keys), dtype=np.int64)
+            np.cumsum(local[:-1], out=first[1:])
+            postings[cursor[gid][gidx] + (np.arange(len(gidx)) - first[gidx])] = rows
+            cursor[gid] += local
+        self.alphabet = alphabet
+        self.grams = grams
+        self.offsets = offsets
+        self.postings = postings
+
+    def _chunk_pairs(self, texts: list, row0: int, alphabet: np.ndarray):
+        """
+        texts（row0 行目から）の重複なしの (gram, 行) の組を gram キー・行の順に並べたもの。
+        戻り値：(gram キー一覧（昇順）, 組ごとのキー一覧の添字 int32, 組ごとの行位置 int32)
+        """
+        n = len(texts)
+        # チャンクの行を NUL 区切りで1本のコードポイント配列にし、位置 → 行番号を引けるようにする
+        codes = _codepoints("\x00".join(texts) + "\x00")
+        lens = np.fromiter((len(t) + 1 for t in texts), dtype=np.int64, count=n)
+        rows = np.repeat(np.arange(n, dtype=np.uint64), lens)
+        ids = np.searchsorted(alphabet, codes).astype(np.uint64) + np.uint64(1)
+        ids[codes == 0] = 0
+        del codes
+        base = np.uint64(len(alphabet) + 1)
+        # k-gram のキー = ID を base 進で並べた値（k ごとに値域が重ならない）。
+        # 区切り（ID 0）を含む gram ＝行をまたぐ gram は除外
+        keys, owners = [], []
+        key = np.zeros(len(ids), dtype=np.uint64)
+        ok = np.ones(len(ids), dtype=bool)
+        for k in range(self.N):
+            m = len(ids) - k
+            key = key[:m] * base + ids[k:]
+            ok = ok[:m] & (ids[k:] != 0)
+            keys.append(key[ok])
+            owners.append(rows[:m][ok])
+        del key, ok, ids, rows
+        keys = np.concatenate(keys)
+        owners = np.concatenate(owners)
+        # (gram, 行) で並べ替えて重複除去。桁あふれしない範囲は1つの整数にまとめて高速に
+        if float(base) ** self.N * n < 2.0 ** 63:
+            combined = keys * np.uint64(n) + owners
+            del keys, owners
+            combined.sort()
+            keys = combined // np.uint64(n)
+            owners = combined % np.uint64(n)
+            del combined
+        else:
+            order = np.lexsort((owners, keys))
+            keys = keys[order]
+            owners = owners[order]
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = (keys[1:] != keys[:-1]) | (owners[1:] != owners[:-1])
+        keys = keys[keep]
+        owners = (owners[keep] + np.uint64(row0)).astype(np.int32)
+        new = np.ones(len(keys), dtype=bool)
+        new[1:] = keys[1:] != keys[:-1]
+        gidx = (np.cumsum(new) - 1).astype(np.int32)
+        return keys[new], gidx, owners
+
+    def is_exact(self, token: str) -> bool:
+        """candidates() がそのまま一致行になるか（確認不要か）。"""
+        low = token.lower()
+        return len(low) <= self.N and len(low) == len(token)
+
+    def _gram_keys(self, token: str):
+        if len(self.alphabet) == 0:
+            return None
+        cps = _codepoints(token.lower())
+        pos = np.minimum(np.searchsorted(self.alphabet, cps), len(self.alphabet) - 1)
+        if np.any(self.alphabet[pos] != cps):
+            return None  # 索引にない文字を含む → どの行にも出現しない
+        ids = pos.astype(np.uint64) + np.uint64(1)
+        base = np.uint64(len(self.alphabet) + 1)
+        k = min(self.N, len(ids))
+        m = len(ids) - k + 1
+        key = np.zeros(m, dtype=np.uint64)
+        for j in range(k):
+            key = key * base + ids[j:j + m]
+        return np.unique(key)
+
+    def _rows_of(self, key) -> np.ndarray:
+        i = int(np.searchsorted(self.grams, key))
+        if i >= len(self.grams) or self.grams[i] != key:
+            return _EMPTY_ROWS
+        return self.postings[self.offsets[i]:self.offsets[i + 1]]
+
+    def candidates(self, token: str) -> np.ndarray:
+        """token のすべての gram を含む行位置（昇順）。"""
+        keys = self._gram_keys(token)
+        if keys is None:
+            return _EMPTY_ROWS
+        lists = sorted((self._rows_of(k) for k in keys), key=len)
+        cand = lists[0]
+        for rows in lists[1:]:
+            if len(cand) == 0:
+                break
+            cand = intersect_rows(cand, rows)
+        return cand
+
+def intersect_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """昇順・重複なしの行位置配列どうしの積集合（短い方を長い方へ二分探索）。"""
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return a
+    pos = np.searchsorted(b, a)
+    pos[pos >= len(b)] = 0
+    return a[b[pos] == a]
+
+# ========= データ読み込み =========
+def schema_usecols(main_cols=None, search_cols=None):
+    """
+    資料シートから読み込む列の判定（列名 → bool）。SEARCH_COLS が None なら None（全列）。
+    詳細検索の欄は列名で決まる（resolve_field_groups）ので、欄のキーワードを含む列も読み込む。
+    main_cols / search_cols（画面ごとの指定）の列も読み込む。
+    """
+    if SEARCH_COLS is None:
+        return None
+    named = (set(SEARCH_COLS) | set(search_cols or ()) | set(main_cols or MAIN_COLS)
+             | set(DETAIL_FIELDS) | set(CATEGORY_COLS) | {"タイトル"})
+    keys = ADV_PERSON_KEYS + ADV_CALLNO_KEYS + ADV_MEDIA_KEYS
+    return lambda c: str(c) in named or any(k in str(c) for k in keys)
+
+def search_columns(columns, search_cols=None) -> list:
+    """
+    __全文__ に連結する列（search_cols のうちシートにある列。無ければ全列）。
+    search_cols を渡さなければ SEARCH_COLS（None なら全列）。
+    """
+    cols = [c for c in columns if not str(c).startswith("__")]
+    if search_cols is None:
+        search_cols = SEARCH_COLS
+    if search_cols is None:
+        return cols
+    return [c for c in cols if c in search_cols] or cols
+
+def schema_key(main_cols=None, search_cols=None):
+    # キャッシュの照合用（スキーマの設定・画面ごとの列の指定・読み込み時に判定する語や
+    # 前もって作るマスク・詳細検索の欄の設定が変わったら作り直す）
+    if search_cols is None:
+        search_cols = SEARCH_COLS
+    return (LOAD_MODE, None if search_cols is None else tuple(search_cols), tuple(main_cols or MAIN_COLS),
+            None if SEARCH_COLS is None else tuple(SEARCH_COLS), tuple(DETAIL_FIELDS),
+            COMPACT_DTYPES and (tuple(COMPACT_CATEGORY_COLS), ARROW_OK),
+            HIROSHIMA_MATCHER.words,  # __広島__ 列の判定に使った語
+            tuple((g, tuple(subs)) for g, subs in GENRE_GROUPS.items()), tuple(ADV_MEDIA_ITEMS),
+            tuple(ADV_PERSON_KEYS), tuple(ADV_CALLNO_KEYS), tuple(ADV_MEDIA_KEYS),
+            tuple(ADV_FIELD_COLS.items()), tuple(CATEGORY_COLS))
+
+def read_workbook(path: Path, main_cols=None, search_cols=None):
+    """
+    ブックを1回だけ開いて、資料シート（SHEET_NAME）と人名シート（NAME_SHEET）を読む。
+    資料シートは schema_usecols() の列だけ読む。人名シートが無い・読めない場合の人名は空リスト。
+    """
+    with pd.ExcelFile(path) as xls:
+        df = xls.parse(SHEET_NAME, usecols=schema_usecols(main_cols, search_cols))
+        try:
+            ser = xls.parse(NAME_SHEET, header=None).iloc[:,0]
+            names = ser.dropna().astype(str).tolist()
+        except Exception:
+            names = []
+    return df, names
+
+def _cell_str(v) -> str:
+    # セル値 → 文字列（空セルは空文字、整数値の float は "12.0" ではなく "12"）
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+def stream_workbook(path: Path, main_cols=None, search_cols=None):
+    """
+    openpyxl の read_only モードで1行ずつ読み、値をその場で文字列にしながら列を組み立てる。
+    STREAM_CHUNK_ROWS 行ごとに列の断片（Series）にし、__全文__ と検索用の列（search_derived）も
+    その断片ごとに作る。全体の文字列リスト・object 表を持たないので、ピークメモリが小さい。
+    戻り値：(df（検索用の列付き）, 人名一覧, 詳細検索の欄)
+    - 見出しの空欄は "Unnamed: n"、重複は "名前.1" のように pandas と同じ名前にする
+    - 見出しより右にはみ出したセル、末尾の空行は読まない
+    - schema_usecols() に当たらない列は文字列にもせず読み飛ばす
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[SHEET_NAME].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        while header and header[-1] is None:
+            header.pop()
+        names_seen = {}
+        columns = []
+        for i, h in enumerate(header):
+            name = f"Unnamed: {i}" if h is None else _cell_str(h)
+            if name in names_seen:
+                names_seen[name] += 1
+                name = f"{name}.{names_seen[name]}"
+            else:
+                names_seen[name] = 0
+            columns.append(name)
+        width = len(columns)
+        use = schema_usecols(main_cols, search_cols)
+        keep = [i for i, c in enumerate(columns) if use is None or use(c)]
+        columns = [columns[i] for i in keep]
+        search = set(search_columns(columns, search_cols))
+        search_pos = [j for j, c in enumerate(columns) if c in search]
+        fields = resolve_field_groups(columns)
+        data = [[] for _ in columns]
+        fulltext = []
+        pieces = {}  # 列名 → 断片の Series（行順）
+
+        def flush():
+            # ためた行を列の断片にし、検索用の列も作る（行の文字列リストはここで手放す）
+            part = pd.DataFrame(dict(zip(columns, data)), columns=columns)
+            part["__全文__"] = fulltext
+            part = part.assign(**search_derived(part, part["__全文__"], fields))
+            for c in part.columns:
+                pieces.setdefault(c, []).append(part[c])
+            for col in data:
+                col.clear()
+            fulltext.clear()
+
+        pending_blank = 0  # 空行は後ろにデータ行が来た時だけ追加する（末尾の空行は捨てる）
+        for row in rows:
+            # 空行の判定は読み飛ばす列も含めて行う（pandas の usecols と同じ行数にする）
+            if all(v is None or v == "" for v in row[:width]):
+                pending_blank += 1
+                continue
+            for _ in range(pending_blank):
+                for col in data:
+                    col.append("")
+                fulltext.append("　" * (len(search_pos) - 1))
+            pending_blank = 0
+            vals = [_cell_str(row[i]) if i < len(row) else "" for i in keep]
+            for col, v in zip(data, vals):
+                col.append(v)
+            fulltext.append("　".join([vals[j] for j in search_pos]))
+            if len(fulltext) >= STREAM_CHUNK_ROWS:
+                flush()
+        if fulltext or not pieces:
+            flush()
+
+        names = []
+        if NAME_SHEET in wb.sheetnames:
+            for row in wb[NAME_SHEET].iter_rows(max_col=1, values_only=True):
+                if row and row[0] is not None:
+                    names.append(_cell_str(row[0]))
+    finally:
+        wb.close()
+
+    # 列ごとに断片をつなぐ（つないだ列から断片を手放すので、全体の複製は1列分まで）
+    order = list(pieces)
+    df = pd.DataFrame({c: pd.concat(pieces.pop(c), ignore_index=True) for c in order}, columns=order, copy=False)
+    return df, names, fields
+
+def resolve_field_groups(columns) -> dict:
+    """詳細検索の欄 → 元の列の一覧（列名で判定。該当なしのときは既定の列名）。"""
+    cols = [c for c in columns if not str(c).startswith("__")]
+    def pick(keys, default):
+        found = [c for c in cols if any(k in str(c) for k in keys)]
+        return found or [c for c in default if c in cols]
+    return {
+        "タイトル": [c for c in ["タイトル"] if c in cols],
+        "人名": pick(ADV_PERSON_KEYS, ["演奏者","作曲者"]),
+        "請求番号": pick(ADV_CALLNO_KEYS, ["請求番号"]),
+        "メディア": pick(ADV_MEDIA_KEYS, []),
+    }
+
+def search_derived(df, fulltext: pd.Series, fields: dict) -> dict:
+    """
+    検索用の列（列名 → 値）。df（シートの列）とその行の全文 fulltext から作る：
+    - __norm__：全文を正規化したもの（人名の頭文字・詳細検索の「内容」・広島の判定用）
+    - __広島__：広島関係の語を含むか（広島関係ボタン用の判定は読み込み時に済ませておく）
+    - 詳細検索の欄ごとに、対象列を改行区切りで連結して正規化した列
+    """
+    norm = normalize_series(fulltext)
+    out = {"__norm__": norm, "__広島__": pd.Series(hiroshima_mask(norm), index=df.index)}
+    for field, col in ADV_FIELD_COLS.items():
+        if field == "内容":
+            continue
+        cols = fields.get(field, [])
+        if cols:
+            joined = df[cols].agg("\n".join, axis=1)
+        else:
+            joined = pd.Series("", index=df.index)
+        out[col] = normalize_series(joined)
+    return out
+
+def build_dataset(path: Path, progress=None, mode: str = None, main_cols=None, search_cols=None):
+    """
+    ブックを読み込んで検索用の列を足す。戻り値：(df, 一覧表示の列, 人名一覧, 詳細検索の欄)
+    main_cols / search_cols は一覧表示・キーワード検索の列（省略時は MAIN_COLS / SEARCH_COLS）。
+    """
+    mode = mode or LOAD_MODE
+    want_main = main_cols or MAIN_COLS
+    if progress:
+        progress("Excel 読み込み中")
+    if mode == "stream":
+        # 値は文字列化済み・__全文__ と検索用の列も作成済み
+        df, names, fields = stream_workbook(path, main_cols, search_cols)
+        if progress:
+            progress("検索用データ作成中")
+    else:
+        df, names = read_workbook(path, main_cols, search_cols)
+        if progress:
+            progress("検索用データ作成中")
+        for c in df.columns:
+            if COMPACT_DTYPES:
+                df[c] = df[c].fillna("").astype(str)  # 空欄は空文字（"nan" にしない）
+            else:
+                df[c] = df[c].astype(str).fillna("")
+        pref_cols = search_columns(df.columns, search_cols)
+        df["__全文__"] = df[pref_cols].agg("　".join, axis=1)
+        fields = resolve_field_groups(df.columns)
+        for c, values in search_derived(df, df["__全文__"], fields).items():
+            df[c] = values
+    # 表示カラム（指定の列のうちシートにある列。無ければシートの先頭から同じ数だけ）
+    main_cols = [c for c in want_main if c in df.columns]
+    if not main_cols:
+        main_cols = [c for c in df.columns if not str(c).startswith("__")][:len(want_main)]
+    # ジャンル・メディアはカテゴリ型に（値の種類ぶんの文字列だけ持つ）
+    for c in CATEGORY_COLS:
+        if c in df.columns:
+            df[c] = df[c].astype("category")
+    if COMPACT_DTYPES:
+        compact_frame(df)
+    return df, main_cols, names, fields
+
+def compact_frame(df: pd.DataFrame):
+    """
+    省メモリ表現に置き換える（その場で変更）。
+    - COMPACT_CATEGORY_COLS：カテゴリ型（値の種類ぶんの文字列＋行ごとの小さな整数コード）
+    - その他の文字列列：pyarrow があれば Arrow 文字列（1本の連続したバッファ）。無ければそのまま
+    """
+    for c in df.columns:
+        if c in COMPACT_CATEGORY_COLS and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype("category")
+        elif ARROW_OK and df[c].dtype == object:
+            df[c] = df[c].astype(pd.StringDtype("pyarrow"))
+
+def bytes_per_record(df: pd.DataFrame) -> int:
+    """資料一覧1件あたりのメモリ量（文字列の中身まで数える）。"""
+    return int(df.memory_usage(deep=True).sum() // max(len(df), 1))
+
+def category_mask(ser: pd.Series, pred) -> np.ndarray:
+    """列の値の種類ごとに pred を1回だけ評価し、行ごとの真偽配列に展開する。"""
+    cat = ser if isinstance(ser.dtype, pd.CategoricalDtype) else ser.astype("category")
+    hit = np.fromiter((bool(pred(str(v))) for v in cat.cat.categories), dtype=bool,
+                      count=len(cat.cat.categories))
+    hit = np.append(hit, False)  # コード -1（欠損）→ 末尾の False
+    return hit[cat.cat.codes.to_numpy()]
+
+def build_filter_masks(df, fields: dict):
+    """
+    ジャンル検索の各ボタン・詳細検索の各メディア種別の行マスクを前もって作る。
+    - ジャンル：『ジャンル』列にボタン名を部分一致（従来の str.contains と同じ）
+    - メディア：メディア系の列のどれかに種別名を部分一致（正規化して比較）
+    """
+    n = len(df)
+    genre_masks = {}
+    if "ジャンル" in df.columns:
+        for subs in GENRE_GROUPS.values():
+            for g in subs:
+                if g not in genre_masks:
+                    genre_masks[g] = category_mask(df["ジャンル"], lambda v, g=g: g in v)
+    media_masks = {}
+    for item in ADV_MEDIA_ITEMS:
+        key = normalize_text(item)
+        mask = np.zeros(n, dtype=bool)
+        for c in fields.get("メディア", []):
+            mask |= category_mask(df[c], lambda v: key in normalize_text(v))
+        media_masks[item] = mask
+    return genre_masks, media_masks
+
+def load_dataset(path: Path, use_cache: bool = True, progress=None, main_cols=None, search_cols=None):
+    """
+    キャッシュが有効ならそれを使い、なければ Excel から組み立ててキャッシュに保存する。
+    （ブックが更新されるとキャッシュは自動で作り直される）
+    progress を渡すと各段階の説明文で呼ばれる（読み込みスレッドから呼ばれる点に注意）。
+    main_cols / search_cols は build_dataset と同じ（画面ごとの一覧・キーワード検索の列）。
+    戻り値：dict
+      df          資料一覧（__全文__ / __norm__ / __広島__ / 詳細検索用の列付き）
+      main_cols   一覧表示の列
+      index       __全文__ の NgramIndex
+      names       人名一覧（Excelの表記そのまま）
+      name_index  人名検索ダイアログの頭文字索引（build_name_index）
+      name_rows   人名 → その人名を含む行位置（build_name_postings）
+      fields      詳細検索の欄 → 元の列の一覧
+      field_index 詳細検索の欄 → その欄の連結列の NgramIndex
+      genre_masks ジャンル検索のボタン → 行マスク（bool 配列）
+      media_masks 詳細検索のメディア種別 → 行マスク（bool 配列）
+      ranker      キーワード検索の並べ替え（Bm25Ranker）
+      bytes_per_record 資料一覧1件あたりのメモリ量（バイト）
+    """
+    if use_cache:
+        if progress:
+            progress("キャッシュ確認中")
+        cached = load_cache(path, schema_key(main_cols, search_cols))
+        if cached is not None:
+            return {k: cached[k] for k in ("df", "main_cols", "index", "names", "name_index", "name_rows",
+                                           "fields", "field_index", "genre_masks", "media_masks",
+                                           "ranker", "bytes_per_record")}
+    st = path.stat()  # 読み込み前の状態をキーにする（読み込み中の更新は次回起動で検出）
+    df, shown_cols, names, fields = build_dataset(path, progress, main_cols=main_cols, search_cols=search_cols)
+    if progress:
+        progress("索引作成中")
+    genre_masks, media_masks = build_filter_masks(df, fields)
+    index = NgramIndex(df["__全文__"])
+    data = {
+        "df": df,
+        "main_cols": shown_cols,
+        "index": index,
+        "names": names,
+        "name_index": build_name_index(names),
+        "name_rows": build_name_postings(df, index, names),
+        "fields": fields,
+        "field_index": {f: NgramIndex(df[c]) for f, c in ADV_FIELD_COLS.items()},
+        "genre_masks": genre_masks,
+        "media_masks": media_masks,
+        "ranker": Bm25Ranker(df),
+        "bytes_per_record": bytes_per_record(df),
+    }
+    if use_cache:
+        if progress:
+            progress("キャッシュ保存中")
+        save_cache(path, data, schema_key(main_cols, search_cols), st)
+    return data
+
+class SearchCancelled(Exception):
+    """より新しい検索が始まったため、この検索を打ち切った。"""
+
+def split_query(q: str) -> list:
+    return [p for p in re.split(r"\s+", q.strip()) if p]
+
+def query_refines(q: str, prev: str) -> bool:
+    """
+    q のヒットが必ず prev のヒットに含まれるか（prev の各語が q のいずれかの語の一部）。
+    例：「交響」→「交響曲」、「広島」→「広島 平和」
+    """
+    prev_parts = [p.lower() for p in split_query(prev)]
+    parts = [p.lower() for p in split_query(q)]
+    return bool(prev_parts) and all(any(pp in p for p in parts) for pp in prev_parts)
+
+def _is_arrow(texts) -> bool:
+    # Arrow 文字列の列か（1件ずつ取り出すと遅いので、まとめて pyarrow の関数で調べる）
+    dtype = getattr(texts, "dtype", None)
+    return isinstance(dtype, pd.StringDtype) and dtype.storage == "pyarrow"
+
+def _contains_chunk(texts, chunk: np.ndarray, pat) -> np.ndarray:
+    if _is_arrow(texts):
+        return pd.Series(texts.take(chunk)).str.contains(pat.pattern, flags=pat.flags).to_numpy(dtype=bool)
+    return np.fromiter((pat.search(texts[i]) is not None for i in chunk), dtype=bool, count=len(chunk))
+
+def _verify_rows(texts, rows: np.ndarray, p: str, cancelled=None) -> np.ndarray:
+    # 候補行だけ大文字小文字を区別せず部分一致を確認（cancelled() が True なら打ち切り）
+    pat = re.compile(re.escape(p), re.IGNORECASE)
+    keep = np.zeros(len(rows), dtype=bool)
+    for s in range(0, len(rows), VERIFY_CHUNK):
+        if cancelled and cancelled():
+            raise SearchCancelled()
+        chunk = rows[s:s + VERIFY_CHUNK]
+        keep[s:s + len(chunk)] = _contains_chunk(texts, chunk, pat)
+    return rows[keep]
+
+def keyword_rows(df, q: str, index: NgramIndex = None, within: np.ndarray = None,
+                 cancelled=None) -> np.ndarray:
+    """
+    キーワード（空白区切りの AND・部分一致・大文字小文字無視）に一致する行位置（昇順）。
+    within を渡すとその行位置の中だけを調べる（前回の結果の絞り込み）。
+    """
+    parts = split_query(q)
+    cand = within
+    if not parts:
+        return np.arange(len(df)) if cand is None else cand
+    texts = df["__全文__"].array
+    if index is None or index.size != len(df):
+        if cand is None:
+            cand = np.arange(len(df))
+        for p in parts:
+            cand = _verify_rows(texts, cand, p, cancelled)
+        return cand
+    # 転置インデックスで候補行を絞り、4文字以上の語だけ候補行で部分一致を確認（AND）
+    for p in parts:
+        rows = index.candidates(p)
+        cand = rows if cand is None else intersect_rows(cand, rows)
+        if len(cand) == 0:
+            return cand
+    for p in parts:
+        if len(cand) == 0:
+            break
+        if not index.is_exact(p):
+            cand = _verify_rows(texts, cand, p, cancelled)
+    return cand
+
+def mask_rows(mask) -> np.ndarray:
+    # 真偽値マスク（Series / ndarray）→ 行位置
+    return np.flatnonzero(np.asarray(mask, dtype=bool))
+
+class QueryCache:
+    """
+    検索結果（行位置の配列）の LRU キャッシュ。キーは (種類, 正規化した条件…) のタプル。
+    入力しながら検索の別スレッドからも使うのでロックで守る。保存した配列は書き換え不可にする。
+    """
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            rows = self._items.get(key)
+            if rows is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return rows
+
+    def put(self, key, rows: np.ndarray) -> np.ndarray:
+        rows = np.asarray(rows)
+        rows.flags.writeable = False
+        with self._lock:
+            self._items[key] = rows
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return rows
+
+    def rows(self, key, compute) -> np.ndarray:
+        """key の結果。無ければ compute() で求めて覚える（compute の例外はそのまま伝える）。"""
+        rows = self.get(key)
+        if rows is None:
+            rows = self.put(key, compute())
+        return rows
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._items)}
+
+def _count_in(texts, rows: np.ndarray, t: str) -> np.ndarray:
+    # rows の各行に t が何回出てくるか（重なりなし）
+    if _is_arrow(texts):
+        return pd.Series(texts.take(rows)).str.count(re.escape(t)).to_numpy(dtype=np.float64)
+    return np.fromiter((texts[i].count(t) for i in rows), dtype=np.float64, count=len(rows))
+
+class Bm25Ranker:
+    """
+    キーワード検索のヒットを関連度順に並べる（BM25F 風）。
+    欄（タイトル / 人名 / 全文）ごとに語の出現回数を欄の長さで正規化し、重みを掛けて足してから飽和させる。
+    分かち書きはしないので、出現回数は部分一致の回数、欄の長さは文字数で数える。
+    欄の長さは読み込み時に数えておき、出現回数はヒットした行だけ数える。
+    重みは並べるたびに RANK_FIELD_WEIGHTS から読む（キャッシュには欄の長さだけが入る）。
+    """
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, df):
+        self.size = len(df)
+        self.lengths = {}  # 欄 → (連結列, 長さ配列, 平均長)
+        for field, col in ADV_FIELD_COLS.items():
+            if col not in df.columns:
+                continue
+            lens = df[col].str.len().to_numpy(dtype=np.float64)
+            self.lengths[field] = (col, lens, max(float(lens.mean()) if len(lens) else 0.0, 1.0))
+
+    def scores(self, df, index: NgramIndex, q: str, rows: np.ndarray) -> np.ndarray:
+        """rows（ヒットした行位置）それぞれの関連度。"""
+        total = np.zeros(len(rows), dtype=np.float64)
+        if len(rows) == 0:
+            return total
+        n = max(self.size, 1)
+        for p in split_query(q):
+            # 語を含む行数（4文字以上は索引の候補数＝上限で近似）
+            nt = len(index.candidates(p)) if index is not None else len(rows)
+            idf = np.log(1.0 + (n - nt + 0.5) / (nt + 0.5))
+            tn = normalize_text(p)
+            tf = np.zeros(len(rows), dtype=np.float64)
+            for field, weight in RANK_FIELD_WEIGHTS.items():
+                if field not in self.lengths:
+                    continue
+                col, lens, avg = self.lengths[field]
+                cnt = _count_in(df[col].array, rows, tn)
+                tf += weight * cnt / (1.0 - self.B + self.B * lens[rows] / avg)
+            total += idf * tf / (self.K1 + tf)
+        return total
+
+class RankedRows:
+    """
+    スコア順の行位置（同点は Excel の行順）。先頭から必要になった分だけ並べる：
+    最初は上位 first 件だけ選んで並べ、ページを進めて足りなくなったら残りから追加で選ぶ。
+    どこまで並べたかによらず、全件を (-スコア, 行順) で並べ替えた順と同じになる。
+    len() / [i] / [a:b] は昇順の行位置配列と同じように使える。
+    """
+    def __init__(self, rows: np.ndarray, scores: np.ndarray, first: int = RANK_TOPK):
+        self.rows = rows
+        self.scores = scores
+        self._order = np.zeros(0, dtype=np.int64)  # 並べ終えた先頭部分（rows の添字）
+        self._rest = np.arange(len(rows))         # まだ並べていない分
+        self._extend(first)
+
+    def _extend(self, k: int):
+        rest = self._rest
+        if k <= 0 or len(rest) == 0:
+            return
+        if k < len(rest):
+            # (-スコア, 行順) で上位 k 件を選ぶ：k 番目のスコアより高い行はすべて、
+            # ちょうど k 番目のスコアの行は行順の早いものから残りの枠の分だけ（rest は昇順のまま保つ）
+            neg = -self.scores[rest]
+            kth = np.partition(neg, k - 1)[k - 1]
+            take = neg < kth
+            tie = np.flatnonzero(neg == kth)
+            take[tie[:k - int(take.sum())]] = True
+            top, rest = rest[take], rest[~take]
+        else:
+            top, rest = rest, rest[:0]
+        top = top[np.lexsort((top, -self.scores[top]))]
+        self._order = np.concatenate([self._order, top])
+        self._rest = rest
+
+    def _need(self, n: int):
+        if n > len(self._order):
+            self._extend(max(n - len(self._order), len(self._order)))  # 足りない分か、並べ済みと同じだけ
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self.rows))
+            self._need(stop)
+            return self.rows[self._order[start:stop:step]]
+        if i < 0:
+            i += len(self.rows)
+        self._need(i + 1)
+        return self.rows[self._order[i]]
+
+def keyword_key(q: str) -> tuple:
+    # 語の順番・大文字小文字・重複は結果に影響しない
+    return ("kw",) + tuple(sorted({p.lower() for p in split_query(q)}))
+
+def field_rows(df, field_index: dict, field: str, q: str) -> np.ndarray:
+    """
+    詳細検索の1欄：正規化した q を含む行位置（昇順）。
+    欄の連結列（正規化済み）の索引で引き、4文字以上の語だけ候補行で部分一致を確認する。
+    """
+    qn = normalize_text(q)
+    index = field_index[field]
+    rows = index.candidates(qn)
+    if len(rows) and not index.is_exact(qn):
+        texts = df[ADV_FIELD_COLS[field]].array
+        if _is_arrow(texts):
+            rows = rows[pd.Series(texts.take(rows)).str.contains(qn, regex=False).to_numpy(dtype=bool)]
+        else:
+            rows = rows[np.fromiter((qn in texts[i] for i in rows), dtype=bool, count=len(rows))]
+    return rows
+
+def phrase_rows(df, index: NgramIndex, s: str) -> np.ndarray:
+    """__全文__ に s をそのまま（空白も区切らず・大文字小文字無視で）含む行位置（昇順）。"""
+    if not s:
+        return np.arange(len(df), dtype=np.int32)
+    if index is None or index.size != len(df):
+        return _verify_rows(df["__全文__"].array, np.arange(len(df), dtype=np.int32), s)
+    rows = index.candidates(s)
+    if len(rows) and not index.is_exact(s):
+        rows = _verify_rows(df["__全文__"].array, rows, s)
+    return rows
+
+def build_name_postings(df, index: NgramIndex, names) -> dict:
+    """『Name』シートの各人名 → その人名を含む資料の行位置（人名検索のダブルクリック・件数表示用）。"""
+    return {nm: phrase_rows(df, index, nm) for nm in set(names)}
+
+# 印刷（視聴申請用紙）の項目 → 列名の候補（小文字化した列名に含まれていれば採用。列名のゆらぎ対応）
+PRINT_FIELD_CANDIDATES = {
+    "登録番号": ["登録番号", "請求番号", "登録", "請求", "catalog", "call", "id"],
+    "メディア": ["メディア", "媒体", "format", "フォーマット"],
+    "タイトル": ["タイトル", "題名", "title", "表題"],
+}
+
+def find_column(columns, candidates):
+    """候補のどれかを含む最初の列名（内部用の __xxx__ 列は除く）。無ければ None。"""
+    for c in columns:
+        key = str(c).lower()
+        if key.startswith("__"):
+            continue
+        if any(cand in key for cand in candidates):
+            return c
+    return None
+
+class RecordLayout:
+    """
+    詳細表示・印刷で使う列の並び。データセットごとに1回だけ作り、全 Record で共有する。
+    印刷項目の列名のゆらぎもここで解決しておく。columns を省略するとタイトル＋DETAIL_FIELDS。
+    """
+    __slots__ = ("columns", "pos", "arrays", "print_cols")
+
+    def __init__(self, df: pd.DataFrame, columns=None):
+        self.print_cols = {label: find_column(df.columns, cands)
+                           for label, cands in PRINT_FIELD_CANDIDATES.items()}
+        if columns is None:
+            columns = ["タイトル"] + DETAIL_FIELDS
+        cols = [c for c in columns if c in df.columns]
+        cols += [c for c in self.print_cols.values() if c is not None and c not in cols]
+        self.columns = tuple(cols)
+        self.pos = {c: i for i, c in enumerate(cols)}
+        # 列のデータそのもの（to_numpy だと Arrow 文字列・カテゴリ型が str の配列に複製されるので使わない）
+        self.arrays = [df[c].array for c in cols]
+
+    def record(self, r: int) -> "Record":
+        return Record(self, tuple(str(a[r]) for a in self.arrays))
+
+class Record:
+    """資料1件の表示用の値（文字列のタプル）。row.get / c in row / row[c] で引ける。"""
+    __slots__ = ("layout", "values")
+
+    def __init__(self, layout: RecordLayout, values: tuple):
+        self.layout = layout
+        self.values = values
+
+    def __contains__(self, col) -> bool:
+        return col in self.layout.pos
+
+    def __getitem__(self, col) -> str:
+        return self.values[self.layout.pos[col]]
+
+    def get(self, col, default=""):
+        i = self.layout.pos.get(col)
+        return default if i is None else self.values[i]
+
+    def keys(self) -> tuple:
+        return self.layout.columns
+
+# ========= 計測 =========
+class _NoSpan:
+    # 計測しないときの span（with で使えるだけで何もしない）
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+class _Span:
+    __slots__ = ("metrics", "name", "t0")
+
+    def __init__(self, metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:  # 打ち切り・エラーで抜けた分は数えない
+            self.metrics.record(self.name, (time.perf_counter() - self.t0) * 1000.0)
+        return False
+
+class Metrics:
+    """
+    処理ごとの所要時間（ミリ秒）を直近 window 回分だけ覚え、p50 / p95 / p99 を出す。
+        with metrics.span("search"):
+            ...
+    enabled が False のときの span は何もしない（時刻も取らない）。別スレッドからも記録できる。
+    """
+    def __init__(self, enabled: bool = METRICS, window: int = METRICS_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self._samples = {}  # 処理名 → deque（直近 window 回の所要時間）
+        self._counts = {}   # 処理名 → 通算回数
+        self._lock = threading.Lock()
+
+    def span(self, name: str):
+        return _Span(self, name) if self.enabled else _NO_SPAN
+
+    def record(self, name: str, ms: float):
+        with self._lock:
+            q = self._samples.get(name)
+            if q is None:
+                q = self._samples[name] = deque(maxlen=self.window)
+            q.append(ms)
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def summary(self) -> dict:
+        """処理名 → {"count": 通算回数, "p50"/"p95"/"p99"/"max": 直近 window 回の所要時間（ミリ秒）}"""
+        with self._lock:
+            items = [(name, np.fromiter(q, dtype=np.float64, count=len(q)), self._counts[name])
+                     for name, q in self._samples.items()]
+        out = {}
+        for name, ms, count in sorted(items):
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            out[name] = {"count": count, "p50": round(float(p50), 3), "p95": round(float(p95), 3),
+                         "p99": round(float(p99), 3), "max": round(float(ms.max()), 3)}
+        return out
+
+    def dump(self, path: Path, extra: dict = None):
+        """現在の summary を path に1行の JSON として追記する（書けない環境では黙って諦める）。"""
+        rec = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "spans": self.summary()}
+        if extra:
+            rec.update(extra)
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        except Exception:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+# ========= 検索ログ =========
+_LOG_STOP = object()  # 書き込みスレッドへの終了の合図
+
+class QueryLog:
+    """
+    検索ログ（追記のみの JSON Lines）。log() はメモリ上のキューに積むだけで、ファイルへは
+    書き込みスレッドが QUERY_LOG_FLUSH_MS ごと（または QUERY_LOG_BATCH 件たまったら）まとめて書く。
+    ファイルが max_bytes を超えそうになったら path.1, path.2 … へ回す（logging の RotatingFileHandler と同じ並び）。
+    close() は残りをすべて書いてからスレッドを止める（2回目以降は何もしない）。書けない環境では黙って捨てる。
+    """
+    def __init__(self, path: Path, max_bytes: int = QUERY_LOG_MAX_BYTES, backups: int = QUERY_LOG_BACKUPS,
+                 flush_ms: int = QUERY_LOG_FLUSH_MS, batch: int = QUERY_LOG_BATCH):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_ms = flush_ms
+        self.batch = batch
+        self.written = 0  # 書き込んだ件数
+        self.dropped = 0  # 書けずに捨てた件数
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="QueryLog", daemon=True)
+        self._thread.start()
+
+    def log(self, kind: str, **fields):
+        """1件記録する（どのスレッドからでも・すぐ戻る）。fields は JSON にできる値。"""
+        if self._closed:
+            return
+        rec = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "kind": kind}
+        rec.update(fields)
+        self._queue.put(rec)
+
+    def close(self, timeout: float = 5.0):
+        # 積まれた分はすべて終了の合図より前にあるので、スレッドが止まるまでに書き切られる
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_LOG_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is _LOG_STOP:
+                return
+            # 最初の1件から QUERY_LOG_FLUSH_MS の間に来た分をまとめて書く（終了の合図が来たらすぐ書く）
+            batch = [first]
+            deadline = time.monotonic() + self.flush_ms / 1000.0
+            while len(batch) < self.batch:
+                try:
+                    rec = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if rec is _LOG_STOP:
+                    stop = True
+                    break
+                batch.append(rec)
+            self._write(batch)
+
+    def _write(self, batch: list):
+        lines = []
+        for rec in batch:
+            try:
+                lines.append((json.dumps(rec, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+            except Exception:
+                self.dropped += 1
+        try:
+            size = self.path.stat().st_size if self.path.exists() else 0
+            f = open(self.path, "ab")
+            try:
+                chunk = []
+                for line in lines:
+                    if size and size + len(line) > self.max_bytes:
+                        f.write(b"".join(chunk))
+                        f.close()
+                        chunk = []
+                        self._rotate()
+                        f = open(self.path, "ab")
+                        size = 0
+                    chunk.append(line)
+                    size += len(line)
+                f.write(b"".join(chunk))
+            finally:
+                f.close()
+            self.written += len(lines)
+        except Exception:
+            self.dropped += len(lines)
+
+    def _rotate(self):
+        # path.(n-1) → path.n … path → path.1（一番古いものは消える）
+        if self.backups <= 0:
+            self.path.unlink()
+            return
+        for i in range(self.backups - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+
+# ========= 検索エンジン =========
+class SearchEngine:
+    """
+    読み込んだデータセット1つ分の検索窓口（Tk を使わない・どのスレッドからでも呼べる）。
+    検索の戻り値はすべて行位置（df の何行目か）の昇順配列で、書き換え不可。
+    同じ条件の再検索は QueryCache から返す（データセットごとに1つ）。
+      search(q)            キーワード検索（空白区切りの AND）
+      rank(q, rows)        キーワード検索の表示順（RankedRows。並べないときは rows のまま）
+      facet(kind, value)   ボタン系の検索：genre / media / hiroshima / name
+      advanced(conds, media) 詳細検索（欄ごとの AND ＋ メディア種別の OR）
+      fetch_page(rows, start, stop) 一覧表示用の値（行ごとの文字列リスト）
+      fetch_record(r)      詳細表示・印刷用の値（Record）
+    """
+    def __init__(self, data: dict):
+        self.data = data
+        self.df = data["df"]
+        self.main_cols = data["main_cols"]
+        self.index = data["index"]
+        self.names = data["names"]
+        self.name_index = data["name_index"]
+        self.name_rows = data["name_rows"]
+        self.fields = data["fields"]
+        self.field_index = data["field_index"]
+        self.genre_masks = data["genre_masks"]
+        self.media_masks = data["media_masks"]
+        self.ranker = data["ranker"]
+        self.bytes_per_record = data["bytes_per_record"]
+        self.cache = QueryCache()
+        self.layout = RecordLayout(self.df)
+        self.main_arrays = [self.df[c].array for c in self.main_cols]  # 複製せず1行ずつ引く
+
+    @classmethod
+    def load(cls, path: Path, use_cache: bool = True, progress=None,
+             main_cols=None, search_cols=None) -> "SearchEngine":
+        """
+        ブックを読み込む（load_dataset。progress は読み込みスレッドから呼ばれる）。
+        main_cols / search_cols で画面ごとの一覧表示・キーワード検索の列を指定できる（省略時は MAIN_COLS / SEARCH_COLS）。
+        """
+        return cls(load_dataset(path, use_cache, progress, main_cols, search_cols))
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    @property
+    def public_columns(self) -> list:
+        # シート由来の列（読み込み時に足した __xxx__ 列を除く）
+        return [c for c in self.df.columns if not str(c).startswith("__")]
+
+    # ---- 検索 ----
+    def search(self, q: str, within: np.ndarray = None, cancelled=None) -> np.ndarray:
+        """
+        キーワード検索。within（q を絞り込む前の検索結果）を渡すとその中だけを調べる。
+        cancelled() が True になったら SearchCancelled で打ち切る（結果は覚えない）。
+        """
+        return self.cache.rows(keyword_key(q),
+                               lambda: keyword_rows(self.df, q, self.index, within, cancelled))
+
+    def rank(self, q: str, rows: np.ndarray):
+        if not RANK_RESULTS or self.ranker is None or not split_query(q):
+            return rows
+        return RankedRows(rows, self.ranker.scores(self.df, self.index, q, rows))
+
+    def facet(self, kind: str, value: str = None) -> np.ndarray:
+        """
+        genre     『ジャンル』列に value を部分一致（ジャンル検索のボタン）
+        media     メディア系の列に value（ADV_MEDIA_ITEMS）を正規化して部分一致
+        hiroshima 広島関係（読み込み時に判定済みの __広島__ 列）
+        name      人名 value を含む資料（読み込み時の対応表。無い人名だけその場で探す）
+        """
+        if kind == "name":
+            rows = self.name_rows.get(value)
+            if rows is None:
+                rows = self.cache.rows(("name", value), lambda: phrase_rows(self.df, self.index, value))
+            return rows
+        if kind == "genre":
+            def compute():
+                mask = self.genre_masks.get(value)
+                if mask is None:
+                    mask = category_mask(self.df["ジャンル"], lambda v: value in v)
+                return mask_rows(mask)
+        elif kind == "media":
+            compute = lambda: mask_rows(self.media_masks[value])
+        elif kind == "hiroshima":
+            if "__広島__" in self.df.columns:
+                compute = lambda: mask_rows(self.df["__広島__"])
+            else:
+                compute = lambda: mask_rows(hiroshima_mask(self.df["__norm__"]))
+        else:
+            raise ValueError(f"facet の種類が不正です: {kind}")
+        return self.cache.rows((kind, value), compute)
+
+    def name_count(self, nm: str) -> int:
+        # 人名検索ダイアログの件数表示用（対応表に無い人名は 0）
+        rows = self.name_rows.get(nm)
+        return 0 if rows is None else len(rows)
+
+    def advanced(self, conds: dict, media=()) -> np.ndarray:
+        """
+        詳細検索。conds は欄（タイトル / 人名 / 内容 / 請求番号）→ 語（AND）、
+        media はチェックしたメディア種別（OR。メディア系の列が無ければ無視）。
+        """
+        key = ("adv", tuple((f, normalize_text(q)) for f, q in conds.items()), tuple(sorted(media)))
+        return self.cache.rows(key, lambda: self._advanced_rows(conds, media))
+
+    def _advanced_rows(self, conds: dict, media) -> np.ndarray:
+        rows = None  # None = 絞り込みなし（全件）
+        # 入力欄：部分一致（AND）
+        for field, q in conds.items():
+            hit = field_rows(self.df, self.field_index, field, q)
+            rows = hit if rows is None else intersect_rows(rows, hit)
+        # メディア種別：チェックされているものだけ許可（OR）— 読み込み時に作ったマスクの OR
+        if media and self.fields.get("メディア"):
+            m_mask = np.zeros(len(self.df), dtype=bool)
+            for m in media:
+                m_mask |= self.media_masks[m]
+            hit = np.flatnonzero(m_mask)
+            rows = hit if rows is None else intersect_rows(rows, hit)
+        return np.arange(len(self.df)) if rows is None else rows
+
+    # ---- 値の取り出し ----
+    def row_values(self, r: int) -> list:
+        # r 行目の一覧表示用の値（main_cols の順）
+        return [str(col[r]) for col in self.main_arrays]
+
+    def fetch_page(self, rows, start: int, stop: int) -> list:
+        """検索結果 rows（配列または RankedRows）の start〜stop-1 件目の一覧表示用の値。"""
+        idx = np.asarray(rows[start:stop], dtype=np.intp)
+        cols = [col.take(idx) for col in self.main_arrays]  # ページの行だけまとめて取り出す
+        return [[str(v) for v in vals] for vals in zip(*cols)]
+
+    def fetch_record(self, r: int, layout: RecordLayout = None) -> Record:
+        # r 行目の詳細表示用の値（layout を省略するとタイトル＋DETAIL_FIELDS＋印刷項目）
+        return (layout or self.layout).record(int(r))
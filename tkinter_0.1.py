@@ -3,9 +3,11 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox
-import pandas as pd
-import re
-import unicodedata
+import numpy as np
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 try:
@@ -14,9 +16,34 @@ try:
 except Exception:
     PIL_OK = False
 
+from search_core import (
+    SearchEngine, Metrics, QueryLog, SearchCancelled, Record, split_query, query_refines, build_name_index,
+    COMPACT_DTYPES, DETAIL_FIELDS, GENRE_GROUPS, ADV_MEDIA_ITEMS, GOJUON_ROWS, PRIMARY_KANA,
+    PRINT_FIELD_CANDIDATES,
+)
+
 # ========= 設定 =========
-SHEET_NAME = "Sheet"
+# 読み込み・検索の設定（シート名・列の使い道・キャッシュ・並べ替えなど）は search_core.py にある
 PAGE_SIZE  = 10   # 検索結果は10行表示
+DETAIL_PREFETCH = 5  # 詳細表示中、前後この件数の資料と隣のページの一覧行を先読みする
+ROW_CACHE_MAX = 5000 # 先読みした行を覚えておく上限（超えたら捨てて作り直す）
+SCROLL_VIEW = False  # True: 検索結果を連続スクロールで表示（起動後も「連続スクロール」で切替可）
+
+LOAD_POLL_MS = 50  # 読み込みスレッドの進捗を見に行く間隔（ミリ秒）
+
+# 入力しながら検索（Enter を待たずに、打ち終わって少し経ったら検索する）
+LIVE_SEARCH = True
+LIVE_SEARCH_DELAY_MS = 300  # 最後のキー入力からこの時間入力が無ければ検索
+
+# スタッフ用の処理時間表示（検索・一覧・詳細の p50/p95/p99。計測の有無は search_core.METRICS）
+METRICS_OVERLAY_KEY = "<Control-Shift-F12>"  # 表示/非表示のキー（画面には案内を出さない）
+METRICS_OVERLAY_MS = 1000  # 表示中の更新間隔（ミリ秒）
+METRICS_FILE = ""          # 空でなければこのファイル（all_data.xlsx と同じフォルダ）へ定期的に追記（JSON Lines）
+METRICS_DUMP_MS = 60000    # 記録ファイルへの追記間隔（ミリ秒）
+
+# 検索ログ（何が検索されたか・件数・所要時間）。all_data.xlsx と同じフォルダに JSON Lines で追記する。
+# 空ならログを取らない。書き込みは別スレッドでまとめて行い、大きくなったら .1 .2 … へ回す（search_core.QueryLog）
+QUERY_LOG_FILE = "query_log.jsonl"
 
 FONT_TITLE = ("Meiryo", 24, "bold")
 FONT_SUB   = ("Meiryo", 14)
@@ -33,154 +60,6 @@ DETAIL_MARGIN_TOP = 40
 DETAIL_MARGIN_BOTTOM = 80
 DETAIL_MARGIN_RIGHT = 40  # 右余白
 
-# --- ひろしま表記ゆれ & 関連語対応 ---
-HIROSHIMA_BASE_TERMS = [
-    "広島","ヒロシマ","ひろしま","廣島","ﾋﾛｼﾏ","hiroshima","HIROSHIMA"
-]
-HIROSHIMA_RELATED_TERMS = [
-    # 地名・施設
-    "平和記念公園","平和公園","原爆ドーム","原爆資料館","宮島","厳島","嚴島","厳島神社",
-    "呉","呉市","江田島","似島","福山","尾道","三次","東広島","安芸","安芸郡","可部","己斐",
-    "紙屋町","八丁堀","広電","路面電車",
-    # 野球・文化
-    "カープ","広島東洋カープ",
-    # 用語
-    "原爆","被爆","被曝","原子爆弾","核兵器",
-]
-
-def _to_hiragana(s: str) -> str:
-    # カタカナ → ひらがな変換（Unicode範囲変換）
-    res = []
-    for ch in s:
-        codepoint = ord(ch)
-        if 0x30A1 <= codepoint <= 0x30F6:  # Katakana small a ... ke
-            res.append(chr(codepoint - 0x60))
-        else:
-            res.append(ch)
-    return "".join(res)
-
-def normalize_text(text: str) -> str:
-    # 全角/半角正規化 → 小文字 → ひらがな化
-    t = unicodedata.normalize("NFKC", str(text or ""))
-    t = t.lower()
-    t = _to_hiragana(t)
-    return t
-
-# 正規化済みキーワード集合（正規化しておく）
-_HIRO_WORDS = [normalize_text(w) for w in (HIROSHIMA_BASE_TERMS + HIROSHIMA_RELATED_TERMS)]
-# すべての語を OR でマッチさせる正規表現
-HIROSHIMA_PATTERN = "(" + "|".join(map(re.escape, _HIRO_WORDS)) + ")"
-
-# 表記ゆれ吸収用（広島）— 3.1.py と同等ヒットになるよう網羅
-HIROSHIMA_VARIANTS = ["広島", "ヒロシマ", "ひろしま", "廣島", "ﾋﾛｼﾏ", "hiroshima", "HIROSHIMA"]
-HIROSHIMA_REGEX = "(" + "|".join(map(re.escape, HIROSHIMA_VARIANTS)) + ")"
-
-# ========= ユーティリティ =========
-def katakana_to_hiragana(s: str) -> str:
-    # カタカナ -> ひらがな（半角->全角も正規化）
-    if not s:
-        return s
-    s = unicodedata.normalize('NFKC', s)
-    res = []
-    for ch in s:
-        code = ord(ch)
-        # カタカナの範囲
-        if 0x30A1 <= code <= 0x30F6:
-            res.append(chr(code - 0x60))
-        else:
-            res.append(ch)
-    return ''.join(res)
-
-# 濁点・半濁点を除いた「行判定用」の基底かなに変換
-DAKUTEN_MAP = str.maketrans({
-    "が":"か","ぎ":"き","ぐ":"く","げ":"け","ご":"こ",
-    "ざ":"さ","じ":"し","ず":"す","ぜ":"せ","ぞ":"そ",
-    "だ":"た","ぢ":"ち","づ":"つ","で":"て","ど":"と",
-    "ば":"は","び":"ひ","ぶ":"ぶ","べ":"へ","ぼ":"ほ",
-    "ぱ":"は","ぴ":"ひ","ぷ":"ふ","ぺ":"へ","ぽ":"ほ",
-    "ゔ":"う",
-    # 小書き文字 -> 基本音
-    "ぁ":"あ","ぃ":"い","ぅ":"う","ぇ":"え","ぉ":"お",
-    "ゃ":"や","ゅ":"ゆ","ょ":"よ","っ":"つ",
-})
-
-GOJUON_ROWS = {
-    "あ": ["あ","い","う","え","お"],
-    "か": ["か","き","く","け","こ"],
-    "さ": ["さ","し","す","せ","そ"],
-    "た": ["た","ち","つ","て","と"],
-    "な": ["な","に","ぬ","ね","の"],
-    "は": ["は","ひ","ふ","へ","ほ"],
-    "ま": ["ま","み","む","め","も"],
-    "や": ["や","ゆ","よ"],
-    "ら": ["ら","り","る","れ","ろ"],
-    "わ": ["わ","を","ん"],
-}
-
-PRIMARY_KANA = ["あ","か","さ","た","な","は","ま","や","ら","わ"]
-
-def name_initial_category(name: str):
-    """
-    先頭の可視文字からカテゴリを決める。
-    - ひらがな/カタカナ -> 五十音の行 + 段（例：'か'行 'き'段）
-    - 英数字 -> 'A'〜'Z' or '0-9'
-    - その他（漢字等）は分類不能なので None を返す（かなフィルタでは除外）
-    """
-    if not name:
-        return None, None
-    s = name.strip()
-    if not s:
-        return None, None
-    ch = s[0]
-    # 正規化（半角->全角、カタカナ->ひらがな）
-    ch_norm = katakana_to_hiragana(ch)
-    # ひらがな
-    if "ぁ" <= ch_norm <= "ん":
-        base = ch_norm.translate(DAKUTEN_MAP)
-        # 行
-        for row, cols in GOJUON_ROWS.items():
-            if base[0] in cols:
-                return ("kana", row, base[0])
-        return ("kana", None, base[0])
-    # 英字/数字
-    ch_nfkc = unicodedata.normalize("NFKC", ch)
-    if ch_nfkc.isalpha():
-        return ("alpha", ch_nfkc.upper(), None)
-    if ch_nfkc.isdigit():
-        return ("digit", "0-9", None)
-    return (None, None, None)
-
-# ========= データ読み込み =========
-def load_dataset(path: Path):
-    df = pd.read_excel(path, sheet_name=SHEET_NAME)
-    for c in df.columns:
-        df[c] = df[c].astype(str).fillna("")
-    pref_cols = list(df.columns)
-    df["__全文__"] = df[list(df.columns)].agg("　".join, axis=1)
-    # 表示カラム固定
-    main_cols = [c for c in ["登録番号","メディア","タイトル","演奏者","作曲者","ジャンル"] if c in df.columns]
-    if not main_cols:
-        main_cols = list(df.columns)[:6]
-    df["__norm__"] = df["__全文__"].apply(normalize_text)
-    return df, main_cols
-
-def load_names(path: Path):
-    try:
-        ser = pd.read_excel(path, sheet_name="Name", header=None).iloc[:,0]
-        names = ser.dropna().astype(str).tolist()
-    except Exception:
-        names = []
-    return names
-
-def keyword_mask(df, q: str):
-    if not q.strip():
-        return pd.Series([True]*len(df), index=df.index)
-    parts = [p for p in re.split(r"\s+", q.strip()) if p]
-    mask = pd.Series([True]*len(df), index=df.index)
-    for p in parts:
-        mask = mask & df["__全文__"].str.contains(re.escape(p), case=False, na=False)
-    return mask
-
 # ========= メインアプリ =========
 class App:
     def __init__(self, root: tk.Tk):
@@ -211,15 +90,27 @@ class App:
         tk.Label(title_frame, text="館内閲覧資料　検索データベース　[ベータ版 v4.6]",
                  font=FONT_SUB, anchor="w", bg="white", fg="black").pack(anchor="w")
 
+        # 読み込み中表示（読み込みが終わったら消す）
+        self.loading_frame = tk.Frame(header, bg="white")
+        self.loading_frame.pack(side="left", padx=(40, 0))
+        self.label_loading = tk.Label(self.loading_frame, text="データ読み込み中…", font=FONT_MED,
+                                      bg="white", fg="#555")
+        self.label_loading.pack(anchor="w")
+        self.loading_bar = ttk.Progressbar(self.loading_frame, mode="indeterminate", length=240)
+        self.loading_bar.pack(anchor="w", pady=(4, 0))
+        self.loading_bar.start(15)
+
         # ==== キーワード検索 ====
         search_frame = tk.Frame(self.root, bg="white")
         search_frame.pack(pady=(16, 8))
         tk.Label(search_frame, text="キーワード検索", font=FONT_LARGE, bg="white", fg="black").pack(anchor="center")
         entry_row = tk.Frame(search_frame, bg="white")
         entry_row.pack(pady=8)
-        self.entry = tk.Entry(entry_row, width=40, font=FONT_LARGE)
+        self.entry = tk.Entry(entry_row, width=40, font=FONT_LARGE, state="disabled")
         self.entry.pack(side="left", padx=(0,10), ipady=8)
         self.entry.bind("<Return>", lambda e: self.do_search())
+        if LIVE_SEARCH:
+            self.entry.bind("<KeyRelease>", self._on_entry_key)
 
         # ==== 機能ボタン ====
         btns = tk.Frame(self.root, bg="white")
@@ -228,14 +119,16 @@ class App:
         tk.Button(btns, text="ホーム", font=FONT_BTN, width=12, height=1,
                   command=self.reset_home).pack(side="left", padx=8)
 
-        tk.Button(btns, text="人名検索", font=FONT_BTN, width=12, height=1,
-                  command=self.open_name_dialog).pack(side="left", padx=8)
-        tk.Button(btns, text="ジャンル検索", font=FONT_BTN, width=12, height=1,
-                  command=self.open_genre_dialog).pack(side="left", padx=8)
-        tk.Button(btns, text="広島関係", font=FONT_BTN, width=12, height=1,
-                  command=self.search_hiroshima).pack(side="left", padx=8)
-        tk.Button(btns, text="詳細検索", font=FONT_BTN, width=12, height=1,
-                  command=self.open_advanced_dialog).pack(side="left", padx=8)
+        # データが揃うまでは押せないようにしておく
+        self.data_btns = []
+        for text, cmd in [("人名検索", self.open_name_dialog),
+                          ("ジャンル検索", self.open_genre_dialog),
+                          ("広島関係", self.search_hiroshima),
+                          ("詳細検索", self.open_advanced_dialog)]:
+            b = tk.Button(btns, text=text, font=FONT_BTN, width=12, height=1,
+                          command=cmd, state="disabled")
+            b.pack(side="left", padx=8)
+            self.data_btns.append(b)
 
         # ==== 件数表示 ====
         self.label_count = tk.Label(self.root, text="", font=FONT_MED, bg="white", fg="black")
@@ -257,9 +150,15 @@ class App:
         self.tree = ttk.Treeview(self.table_area, show="headings", height=PAGE_SIZE)
         self.tree.pack(side="left", fill="both", expand=True)
 
-        scroll = ttk.Scrollbar(self.table_area, orient="vertical", command=self.tree.yview)
-        scroll.pack(side="right", fill="y")
-        self.tree.configure(yscroll=scroll.set)
+        # Treeview には表示窓ぶん（PAGE_SIZE 行）だけ行を作り、スクロールやページ送りでは
+        # 中身を差し替えて使い回す。スクロールバーは検索結果全体に対する位置を表す
+        self.scroll = ttk.Scrollbar(self.table_area, orient="vertical", command=self._on_scrollbar)
+        self.scroll.pack(side="right", fill="y")
+        self.tree_pool = [self.tree.insert("", "end", iid=f"row{i}") for i in range(PAGE_SIZE)]
+        self.tree.detach(*self.tree_pool)
+        self.pool_shown = 0  # 現在表示している行数（tree_pool の先頭から）
+        for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(seq, self._on_wheel)
 
         # 交互色タグ
         self.tree.tag_configure("odd", background="#f2f2f2")
@@ -281,16 +180,94 @@ class App:
             b = tk.Button(self.nav, text=text, font=FONT_MED, command=cmd,
                           relief="groove", borderwidth=2, width=8)
             b.pack(side="left", padx=6, pady=8)
+        self.scroll_mode = tk.BooleanVar(value=SCROLL_VIEW)
+        tk.Checkbutton(self.nav, text="連続スクロール", font=FONT_MED, bg="white",
+                       variable=self.scroll_mode, command=self._on_scroll_mode).pack(side="left", padx=16)
 
-        # ==== データ ====
+        # 状態
+        self.engine = None    # 検索エンジン（search_core.SearchEngine。読み込み完了で作成）
+        self.df_all = None
+        self.main_cols = []
+        self.name_index = build_name_index([])
+        self.hit_rows = None  # 検索結果＝df_all の行位置（整数配列、キーワード検索は RankedRows）。行は複製しない
+        self.view_top = 0     # 表示窓の先頭が検索結果の何件目か（0 始まり）
+        self.render_after_id = None
+
+        # キーワード検索の状態（入力しながら検索・前回結果の絞り込み用）
+        self.last_kw = None           # (検索語, 行位置) … 直近のキーワード検索結果
+        self.live_text = ""           # 入力しながら検索で最後に受け付けた入力欄の文字列
+        self.live_seq = 0             # 新しい検索を始めるたびに +1（古い検索の打ち切り判定）
+        self.live_after_id = None
+        self.live_polling = False
+        self.live_results = queue.Queue()
+        self.live_pool = ThreadPoolExecutor(max_workers=1)
+        self.live_future = None
+
+        # 検索ログ（ウィンドウを閉じたときに残りを書き切る）
+        self.query_log = QueryLog(Path(__file__).resolve().parent / QUERY_LOG_FILE) if QUERY_LOG_FILE else None
+        self.root.bind("<Destroy>", self._on_root_destroy, add="+")
+
+        # 処理時間の計測（METRICS_OVERLAY_KEY で表示）
+        self.metrics = Metrics()
+        self.metrics_label = None
+        self.metrics_after_id = None
+        self.root.bind_all(METRICS_OVERLAY_KEY, self._toggle_metrics_overlay)
+        if METRICS_FILE and self.metrics.enabled:
+            self.root.after(METRICS_DUMP_MS, self._dump_metrics)
+
+        # 詳細ウィンドウ管理（完全版）— ウィンドウは初回に作り、以降は表示/非表示と中身の差し替えだけ
+        self.detail_win = None
+        self.detail_canvas = None
+        self.detail_abs_index = None   # 表示中の資料（検索結果の何件目か）。None＝閉じている
+        self.record_cache = {}         # df_all の行位置 → Record（前後の先読み分も入る）
+        self.row_cache = {}            # df_all の行位置 → 一覧表示用の値リスト
+        self.prefetch_after_id = None
+        self.detail_labels = {}
+        self.prev_btn = None
+        self.next_btn = None
+
+        # ==== データ（別スレッドで読み込み、結果は after で Tk スレッドへ受け渡す） ====
         excel_path = Path(__file__).resolve().parent / "all_data.xlsx"
+        self.load_queue = queue.Queue()
+        threading.Thread(target=self._load_worker, args=(excel_path,), daemon=True).start()
+        self.root.after(LOAD_POLL_MS, self._poll_loader)
+
+    # ==== データ読み込み（別スレッド） ====
+    def _load_worker(self, excel_path: Path):
+        # ここでは Tk を触らない（結果はすべてキュー経由）
+        post = self.load_queue.put
         try:
-            self.df_all, self.main_cols = load_dataset(excel_path)
-            self.all_names = load_names(excel_path)  # 人名（Excelの表記をそのまま使う）
+            with self.metrics.span("load"):
+                engine = SearchEngine.load(excel_path, progress=lambda msg: post(("progress", msg)))
+            post(("dataset", engine))
         except Exception as e:
-            messagebox.showerror("エラー", f"Excel 読み込み失敗: {e}")
-            self.root.destroy()
-            return
+            post(("error", e))
+
+    def _poll_loader(self):
+        try:
+            while True:
+                kind, value = self.load_queue.get_nowait()
+                if kind == "progress":
+                    self.label_loading.config(text=f"{value}…")
+                elif kind == "dataset":
+                    self._on_dataset_loaded(value)
+                    return
+                elif kind == "error":
+                    messagebox.showerror("エラー", f"Excel 読み込み失敗: {value}")
+                    self.root.destroy()
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(LOAD_POLL_MS, self._poll_loader)
+
+    def _on_dataset_loaded(self, engine: SearchEngine):
+        # 検索結果のキャッシュはエンジンごと（読み込み直すと空から）
+        self.engine = engine
+        self.df_all = engine.df
+        self.main_cols = engine.main_cols
+        self.name_index = engine.name_index
+        self.record_cache = {}
+        self.row_cache = {}
 
         # Treeviewカラム設定
         cols_ids = [f"c{i+1}" for i in range(len(self.main_cols))]
@@ -303,16 +280,15 @@ class App:
                 col_width = 180
             self.tree.column(cols_ids[i], width=col_width, anchor="w", stretch=False)
 
-        # 状態
-        self.df_hits = None
-        self.page = 1
-
-        # 詳細ウィンドウ管理（完全版）
-        self.detail_win = None
-        self.detail_abs_index = None
-        self.detail_labels = {}
-        self.prev_btn = None
-        self.next_btn = None
+        self.loading_bar.stop()
+        self.loading_frame.pack_forget()
+        if COMPACT_DTYPES:
+            self.label_count.config(
+                text=f"資料 {len(engine):,} 件（1件あたり約 {engine.bytes_per_record:,} バイト）")
+        self.entry.configure(state="normal")
+        self.entry.focus_set()
+        for b in self.data_btns:
+            b.configure(state="normal")
 
     # --- 列リサイズ抑止用ハンドラ ---
     def _block_resize(self, event):
@@ -322,44 +298,254 @@ class App:
 
     # ==== 検索処理 ====
     def do_search(self):
+        if self.df_all is None:
+            return
+        self._cancel_live_search()
         q = self.entry.get()
-        mask = keyword_mask(self.df_all, q)
-        self.df_hits = self.df_all[mask].copy()
-        self.page = 1
+        self.live_text = q
+        t0 = time.perf_counter()
+        with self.metrics.span("keyword.search"):
+            rows = self.engine.search(q, within=self._refine_base(q))
+        with self.metrics.span("keyword.rank"):
+            ranked = self.engine.rank(q, rows)
+        self._log_query("keyword", len(rows), t0, q=q)
+        self._show_keyword_hits(q, rows, ranked)
+
+    def _refine_base(self, q: str):
+        # 直前のキーワード検索を絞り込むだけで済む入力なら、その結果の行位置
+        if self.last_kw is not None and query_refines(q, self.last_kw[0]):
+            return self.last_kw[1]
+        return None
+
+    def _show_keyword_hits(self, q: str, rows: np.ndarray, ranked=None):
+        # rows は昇順（次の絞り込み用に覚える）、ranked は表示順
+        self.last_kw = (q, rows) if split_query(q) else None
+        self.hit_rows = rows if ranked is None else ranked
+        self.view_top = 0
         self.update_table()
         self.close_detail_if_exists()
 
+    # ==== 入力しながら検索 ====
+    def _on_entry_key(self, event=None):
+        # 入力が止まって LIVE_SEARCH_DELAY_MS 経ったら検索（文字が変わらないキーは無視）
+        if self.df_all is None or self.entry.get() == self.live_text:
+            return
+        if self.live_after_id is not None:
+            self.root.after_cancel(self.live_after_id)
+        self.live_after_id = self.root.after(LIVE_SEARCH_DELAY_MS, self._start_live_search)
+
+    def _cancel_live_search(self):
+        if self.live_after_id is not None:
+            self.root.after_cancel(self.live_after_id)
+            self.live_after_id = None
+        self.live_seq += 1  # 実行中・待機中の検索は結果を捨てる
+
+    def _set_entry_text(self, text: str):
+        # プログラムから検索欄を書き換える（入力しながら検索は起こさない）
+        self._cancel_live_search()
+        self.entry.delete(0, tk.END)
+        self.entry.insert(0, text)
+        self.live_text = text
+        self.last_kw = None
+
+    def _start_live_search(self):
+        self.live_after_id = None
+        q = self.entry.get()
+        self.live_text = q
+        self.live_seq += 1
+        seq = self.live_seq
+        if not split_query(q):
+            # 入力を消したら初期表示に戻す
+            self.last_kw = None
+            self.hit_rows = None
+            self.view_top = 0
+            self.update_table()
+            self.label_count.config(text="")
+            return
+        base = self._refine_base(q)
+        self.live_future = self.live_pool.submit(self._live_worker, seq, q, base)
+        if not self.live_polling:
+            self.live_polling = True
+            self.root.after(LOAD_POLL_MS, self._poll_live_search)
+
+    def _live_worker(self, seq: int, q: str, base):
+        # 別スレッド：Tk は触らず、結果はキューで返す。新しい検索が始まったら途中で打ち切る
+        if seq != self.live_seq:
+            return
+        t0 = time.perf_counter()
+        try:
+            with self.metrics.span("keyword.search"):
+                rows = self.engine.search(q, within=base, cancelled=lambda: seq != self.live_seq)
+            if seq != self.live_seq:
+                return
+            with self.metrics.span("keyword.rank"):
+                ranked = self.engine.rank(q, rows)
+        except SearchCancelled:
+            return
+        self.live_results.put((seq, q, rows, ranked, (time.perf_counter() - t0) * 1000.0))
+
+    def _poll_live_search(self):
+        latest = None
+        try:
+            while True:
+                latest = self.live_results.get_nowait()
+        except queue.Empty:
+            pass
+        if latest is not None and latest[0] == self.live_seq:
+            _, q, rows, ranked, ms = latest
+            self._log_query("keyword", len(rows), ms=ms, q=q, live=True)
+            self._show_keyword_hits(q, rows, ranked)
+        if self.live_future.done() and self.live_results.empty():
+            self.live_polling = False
+            return
+        self.root.after(LOAD_POLL_MS, self._poll_live_search)
+
+    def row_values(self, r: int) -> list:
+        # df_all の r 行目の一覧表示用の値（先読み済みならそれを使う）
+        vals = self.row_cache.get(r)
+        if vals is None:
+            if len(self.row_cache) >= ROW_CACHE_MAX:
+                self.row_cache.clear()
+            vals = self.row_cache[r] = self.engine.row_values(r)
+        return vals
+
+    def detail_record(self, i: int) -> Record:
+        # 検索結果の i 件目の詳細表示用の値（先読み済みならそれを使う）
+        r = int(self.hit_rows[i])
+        rec = self.record_cache.get(r)
+        if rec is None:
+            if len(self.record_cache) >= ROW_CACHE_MAX:
+                self.record_cache.clear()
+            rec = self.record_cache[r] = self.engine.fetch_record(r)
+        return rec
+
+    def _prefetch_around(self, i: int):
+        # 前資料/次資料の先読みはアイドル時に（キーを押しっぱなしでも表示を待たせない）
+        if self.prefetch_after_id is not None:
+            self.root.after_cancel(self.prefetch_after_id)
+        self.prefetch_after_id = self.root.after_idle(self._prefetch, i)
+
+    def _prefetch(self, i: int):
+        self.prefetch_after_id = None
+        if self.hit_rows is None:
+            return
+        n = len(self.hit_rows)
+        for j in range(max(0, i - DETAIL_PREFETCH), min(n, i + DETAIL_PREFETCH + 1)):
+            self.detail_record(j)
+        # 隣のページ（表示窓）の一覧行
+        for top in (self.view_top - PAGE_SIZE, self.view_top + PAGE_SIZE):
+            for r in self.hit_rows[max(0, top):max(0, min(n, top + PAGE_SIZE))]:
+                self.row_values(int(r))
+
     def update_table(self):
-        for r in self.tree.get_children():
-            self.tree.delete(r)
-        if self.df_hits is None or self.df_hits.empty:
+        with self.metrics.span("update_table"):
+            self._update_table()
+
+    def _update_table(self):
+        if self.hit_rows is None or len(self.hit_rows) == 0:
+            self._render_window()
             self.label_count.config(text="ヒット件数: 0")
             self.table_area.pack_forget()
             self.nav.pack_forget()
             self.close_detail_if_exists()
             return
-        total = len(self.df_hits)
-        start = (self.page - 1) * PAGE_SIZE
-        end   = min(start + PAGE_SIZE, total)
-        view = self.df_hits.iloc[start:end]
-        rows = view[self.main_cols].astype(str).values.tolist()
-        for i, vals in enumerate(rows):
-            tag = "odd" if i % 2 else "even"
-            self.tree.insert("", "end", values=vals, tags=(tag,))
-        pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
-        self.label_count.config(text=f"ヒット件数: {total}   ページ {self.page}/{pages}")
+        self._render_window()
         self.table_area.pack(fill="both", expand=True, padx=20, pady=8)
         self.nav.pack(anchor="w", padx=40, pady=4)
 
+    def _render_window(self):
+        # 表示窓（view_top から PAGE_SIZE 件）の値だけを使い回しの Treeview 行へ流し込む
+        if self.render_after_id is not None:
+            self.root.after_cancel(self.render_after_id)
+            self.render_after_id = None
+        rows = np.zeros(0, dtype=np.int32) if self.hit_rows is None else self.hit_rows
+        total = len(rows)
+        top = self.view_top
+        window = rows[top:top + PAGE_SIZE]
+        tree = self.tree
+        if tree.selection():
+            tree.selection_remove(*tree.selection())
+        for i, iid in enumerate(self.tree_pool):
+            if i < len(window):
+                r = window[i]
+                tree.item(iid, values=self.row_values(r),
+                          tags=("odd" if (top + i) % 2 else "even",))
+                if i >= self.pool_shown:
+                    tree.move(iid, "", i)
+            elif i < self.pool_shown:
+                tree.detach(iid)
+        self.pool_shown = len(window)
+        if not total:
+            self.scroll.set(0.0, 1.0)
+            return
+        self.scroll.set(top / total, (top + len(window)) / total)
+        if self.scroll_mode.get():
+            self.label_count.config(text=f"ヒット件数: {total}   {top + 1}～{top + len(window)} 件目")
+        else:
+            pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+            self.label_count.config(text=f"ヒット件数: {total}   ページ {top // PAGE_SIZE + 1}/{pages}")
+
+    def _scroll_to(self, top: int, now: bool = False):
+        """
+        表示窓の先頭を top 件目へ。ページ表示では PAGE_SIZE 単位に揃える。
+        now=False のときは描画を after_idle にまとめ、連続したスクロールでも描画は1回で済ませる。
+        """
+        if self.hit_rows is None:
+            return
+        total = len(self.hit_rows)
+        if self.scroll_mode.get():
+            top = min(top, total - PAGE_SIZE)
+        else:
+            top = min(top, total - 1) // PAGE_SIZE * PAGE_SIZE
+        top = max(top, 0)
+        if top != self.view_top:
+            self.view_top = top
+            if now:
+                self._render_window()
+            elif self.render_after_id is None:
+                self.render_after_id = self.root.after_idle(self._render_window)
+
+    def _on_scrollbar(self, *args):
+        # ttk.Scrollbar の command: ("moveto", 割合) / ("scroll", 数, "units"|"pages")
+        if self.hit_rows is None:
+            return
+        if args[0] == "moveto":
+            self._scroll_to(int(float(args[1]) * len(self.hit_rows)))
+        elif args[0] == "scroll":
+            step = PAGE_SIZE if args[2] == "pages" or not self.scroll_mode.get() else 1
+            self._scroll_to(self.view_top + int(args[1]) * step)
+
+    def _on_wheel(self, event):
+        up = getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0
+        step = 3 if self.scroll_mode.get() else PAGE_SIZE
+        self._scroll_to(self.view_top + (-step if up else step))
+        return "break"
+
+    def _on_scroll_mode(self):
+        # 切替時は、いま先頭にある行を含む位置から表示し直す
+        if self.hit_rows is None:
+            return
+        top = self.view_top
+        self.view_top = -1
+        self._scroll_to(top, now=True)
+
     # ==== ホームに戻る ====
     def reset_home(self):
-        self.df_hits = None
-        self.page = 1
+        self.hit_rows = None
+        self.view_top = 0
         self.update_table()
         self.label_count.config(text="")
-        self.entry.delete(0, tk.END)
+        self._set_entry_text("")
 
     # ==== 人名検索（タブ式：かなが左・デフォルト選択、英字/数字は右） ====
+    def person_rows(self, nm: str) -> np.ndarray:
+        # 人名を含む行位置（読み込み時に作った対応表。無い人名だけその場で探す）
+        with self.metrics.span("name"):
+            return self.engine.facet("name", nm)
+
+    def name_hit_count(self, nm: str) -> int:
+        return self.engine.name_count(nm)
+
     def open_name_dialog(self):
         dlg = tk.Toplevel(self.root, bg="white")
         dlg.title("人名検索")
@@ -425,19 +611,16 @@ class App:
         alpha_sb.pack(side="right", fill="y")
 
         # ---- データ供給関数 ----
+        shown = {}  # Listbox → 表示中の人名（表示文字列には件数を付けるので、選択はこちらで引く）
+
+        def fill_names(lst: tk.Listbox, items: list):
+            shown[lst] = items
+            lst.delete(0, tk.END)
+            lst.insert(tk.END, *(f"{nm}　（{self.name_hit_count(nm)}）" for nm in items))
+
         def filter_names_by_kana_row(row_key: str, syllable: str=None):
-            # Excel表記そのままの人名から、先頭のかな行/段でフィルタ
-            res = []
-            for nm in self.all_names:
-                cat, row, col = name_initial_category(nm)
-                if cat != "kana":
-                    continue
-                if row != row_key:
-                    continue
-                if syllable is not None and col != syllable:
-                    continue
-                res.append(nm)
-            return sorted(set(res))
+            # Excel表記そのままの人名から、先頭のかな行/段で絞った一覧（読み込み時に作成済み）
+            return self.name_index["kana"].get(row_key, {}).get(syllable, [])
 
         def show_kana_row(row_key: str):
             # 行ボタンの強調
@@ -454,42 +637,25 @@ class App:
             populate_kana(row_key, None)
 
         def populate_kana(row_key: str, syllable: str):
-            name_list.delete(0, tk.END)
-            items = filter_names_by_kana_row(row_key, syllable)
-            for nm in items:
-                name_list.insert(tk.END, nm)
+            fill_names(name_list, filter_names_by_kana_row(row_key, syllable))
 
         def populate_alpha(symbol: str):
-            alpha_list.delete(0, tk.END)
-            res = []
-            for nm in self.all_names:
-                s = nm.strip()
-                if not s:
-                    continue
-                ch = unicodedata.normalize("NFKC", s[0])
-                if symbol == "0-9":
-                    ok = ch.isdigit()
-                else:
-                    ok = ch.isalpha() and ch.upper() == symbol
-                if ok:
-                    res.append(nm)
-            for nm in sorted(set(res), key=lambda x: x.upper()):
-                alpha_list.insert(tk.END, nm)
+            fill_names(alpha_list, self.name_index["alpha"].get(symbol, []))
 
         # ダブルクリックで検索
         def do_search_selected_from_list(lst: tk.Listbox):
             sel = lst.curselection()
             if not sel:
                 return
-            nm = lst.get(sel[0])  # Excel表記をそのまま使う
-            self.entry.delete(0, tk.END)
-            self.entry.insert(0, nm)
-            mask = self.df_all["__全文__"].str.contains(re.escape(nm), case=False, na=False)
-            self.df_hits = self.df_all[mask].copy()
-            self.page = 1
+            nm = shown[lst][sel[0]]  # Excel表記をそのまま使う
+            self._set_entry_text(nm)
+            t0 = time.perf_counter()
+            self.hit_rows = self.person_rows(nm)
+            self._log_query("name", len(self.hit_rows), t0, q=nm)
+            self.view_top = 0
             self.update_table()
             self.close_detail_if_exists()
-            self.label_count.config(text=f"人名検索: {nm} 件数 {len(self.df_hits)}")
+            self.label_count.config(text=f"人名検索: {nm} 件数 {len(self.hit_rows)}")
             try:
                 dlg.grab_release()
             except Exception:
@@ -525,15 +691,7 @@ class App:
 
     # ==== ジャンル検索（ダイアログは簡易のまま） ====
     def open_genre_dialog(self):
-        groups = {
-            "クラシック": ["交響曲","管弦楽曲","協奏曲","室内楽曲","独奏曲","歌劇","声楽曲","宗教曲","現代音楽","その他"],
-            "ポピュラー": ["ヴォーカル, フォーク","ソウル, ブルース","ジャズ, ジャズ・ボーカル","ロック",
-                          "シャンソン, カンツォーネ","ムード","ラテン","カントリー&ウェスタン, ハワイアン",
-                          "歌謡曲, 日本のポピュラーソング","その他"],
-            "その他の音楽": ["邦楽","日本民謡","唱歌など","外国民謡など","体育など","広島県関連"],
-            "音楽以外": ["園芸","文芸","演劇","語学","記録","効果音","その他"],
-            "児童": ["児童音楽","児童文芸"]
-        }
+        groups = GENRE_GROUPS
 
         dlg = tk.Toplevel(self.root, bg="white")
         dlg.title("ジャンル検索")
@@ -645,7 +803,7 @@ class App:
         checks_frame = tk.Frame(media_frame, bg="white")
         checks_frame.grid(row=0, column=1, sticky="w")
 
-        media_items = ["ビデオテープ", "DVD", "レコード", "コンパクトカセットテープ"]
+        media_items = ADV_MEDIA_ITEMS
         self.adv_media_vars = {}
         for i, m in enumerate(media_items):
             var = tk.BooleanVar(value=True)
@@ -693,12 +851,15 @@ class App:
             if dlg and dlg.winfo_exists():
                 dlg.destroy()
             return
-        mask = self.df_all["ジャンル"].str.contains(re.escape(genre), na=False)
-        self.df_hits = self.df_all[mask].copy()
-        self.page = 1
+        self._cancel_live_search()
+        t0 = time.perf_counter()
+        with self.metrics.span("genre"):
+            self.hit_rows = self.engine.facet("genre", genre)
+        self._log_query("genre", len(self.hit_rows), t0, q=genre)
+        self.view_top = 0
         self.update_table()
         self.close_detail_if_exists()
-        self.label_count.config(text=f"ジャンル検索: {genre}　件数 {len(self.df_hits)}")
+        self.label_count.config(text=f"ジャンル検索: {genre}　件数 {len(self.hit_rows)}")
         if dlg and dlg.winfo_exists():
             dlg.destroy()
 
@@ -707,72 +868,81 @@ class App:
         """
         『広島/ひろしま/ﾋﾛｼﾏ/ヒロシマ/廣島/hiroshima』に加え、
         広島に関連する地名・施設・用語（平和記念公園、原爆ドーム、宮島、呉、カープ 等）を
-        正規化(__norm__)に対して部分一致で検索します。
+        正規化(__norm__)に対して部分一致で検索します（判定は読み込み時に __広島__ 列へ済ませてある）。
         """
-        if "__norm__" not in self.df_all.columns:
+        if "__広島__" not in self.df_all.columns and "__norm__" not in self.df_all.columns:
             messagebox.showerror("エラー", "検索対象列『__norm__』が見つかりません。Excelの読み込み処理をご確認ください。")
             return
-        if not HIROSHIMA_PATTERN:
-            messagebox.showerror("エラー", "広島関連キーワードのパターンが生成できていません。")
-            return
 
-        try:
-            mask = self.df_all["__norm__"].str.contains(HIROSHIMA_PATTERN, na=False, regex=True)
-        except Exception:
-            # 念のためフォールバック（正規化+部分一致）
-            words = [normalize_text(w) for w in (HIROSHIMA_BASE_TERMS + HIROSHIMA_RELATED_TERMS)]
-            def _contains_any(t: str) -> bool:
-                s = normalize_text(t)
-                return any(w in s for w in words)
-            mask = self.df_all["__norm__"].apply(_contains_any)
-
-        self.df_hits = self.df_all[mask].copy()
-        self.page = 1
+        t0 = time.perf_counter()
+        with self.metrics.span("hiroshima"):
+            self.hit_rows = self.engine.facet("hiroshima")
+        self._log_query("hiroshima", len(self.hit_rows), t0)
+        self.view_top = 0
         self.update_table()
         self.close_detail_if_exists()
-        self.label_count.config(text=f"広島関係検索: 件数 {len(self.df_hits)}")
+        self.label_count.config(text=f"広島関係検索: 件数 {len(self.hit_rows)}")
 
         # 検索欄に「広島」を残す
-        self.entry.delete(0, tk.END)
-        self.entry.insert(0, "広島")
+        self._set_entry_text("広島")
     def on_row_double_click(self, event):
-        if self.df_hits is None or self.df_hits.empty:
+        if self.hit_rows is None or len(self.hit_rows) == 0:
             return
         sel = self.tree.selection()
         if not sel:
             return
         item_id = sel[0]
-        idx_in_page = self.tree.index(item_id)
-        start = (self.page - 1) * PAGE_SIZE
-        abs_idx = start + idx_in_page
-        self.close_detail_if_exists()
-        self.create_detail_window(self.df_hits.iloc[abs_idx], abs_idx)
+        abs_idx = self.view_top + self.tree.index(item_id)
+        self.show_detail(abs_idx)
 
     def on_row_select_maybe_close_detail(self, event):
         # 詳細が開いている間は閉じない
-        if self.detail_win and self.detail_win.winfo_exists():
+        if self.detail_abs_index is not None:
             return
         self.close_detail_if_exists()
 
-    def create_detail_window(self, row: pd.Series, abs_index: int):
-        self.detail_abs_index = abs_index
-        self.root.update_idletasks()
-
+    def _detail_geometry(self):
         screen_h = self.root.winfo_screenheight()
         screen_w = self.root.winfo_screenwidth()
         win_w = int(screen_w * 0.5) - DETAIL_MARGIN_RIGHT  # 右余白あり
         win_h = screen_h - (DETAIL_MARGIN_TOP + DETAIL_MARGIN_BOTTOM)
         x = screen_w - win_w - DETAIL_MARGIN_RIGHT
         y = DETAIL_MARGIN_TOP
+        return win_w, win_h, x, y
+
+    def show_detail(self, abs_index: int):
+        """検索結果の abs_index 件目を詳細ウィンドウに表示（ウィンドウが無ければ作る）。"""
+        with self.metrics.span("detail.show"):
+            self._show_detail(abs_index)
+
+    def _show_detail(self, abs_index: int):
+        if self.detail_win is None or not self.detail_win.winfo_exists():
+            with self.metrics.span("detail.create"):
+                self.create_detail_window()
+        win = self.detail_win
+        self.detail_abs_index = abs_index
+        self.update_detail_labels(self.detail_record(abs_index))
+        self.update_detail_nav_buttons()
+        self._prefetch_around(abs_index)
+        if win.state() == "withdrawn":
+            win_w, win_h, x, y = self._detail_geometry()
+            win.geometry(f"{win_w}x{win_h}+{x}+{y}")
+            win.deiconify()
+        win.transient(self.root)
+        win.grab_set()
+        win.focus_force()
+
+    def create_detail_window(self):
+        self.root.update_idletasks()
+        win_w, win_h, x, y = self._detail_geometry()
 
         win = tk.Toplevel(self.root, bg="white")
         win.title("詳細表示")
         win.geometry(f"{win_w}x{win_h}+{x}+{y}")
         win.resizable(True, True)
-
-        win.transient(self.root)
-        win.grab_set()
-        win.focus_force()
+        win.protocol("WM_DELETE_WINDOW", self.close_detail_if_exists)  # × も「閉じる」と同じく隠すだけ
+        win.bind("<Left>", lambda e: self.nav_detail(-1))
+        win.bind("<Right>", lambda e: self.nav_detail(+1))
 
         rootf = tk.Frame(win, bg="white")
         rootf.pack(fill="both", expand=True)
@@ -792,22 +962,23 @@ class App:
         vbar.pack(side="right", fill="y")
         content.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
         canvas.bind("<Configure>", lambda e: canvas.itemconfigure(content_id, width=e.width))
+        self.detail_canvas = canvas
 
+        # 値は show_detail() → update_detail_labels() で差し替える
         pad = 14
         self.detail_labels = {}
-        lbl_title = tk.Label(content, text=row.get("タイトル",""),
+        lbl_title = tk.Label(content, text="",
                              font=("Meiryo", 18, "bold"),
                              anchor="w", justify="left", wraplength=win_w - pad*2,
                              bg="white", fg="black")
         lbl_title.pack(fill="x", padx=pad, pady=(pad, 6))
         self.detail_labels["タイトル"] = lbl_title
 
-        fields = [c for c in ["作曲者","演奏者","ジャンル","メディア",
-                              "登録番号","レコード番号","レーベル","内容"] if c in row.index]
+        fields = [c for c in DETAIL_FIELDS if c in self.df_all.columns]
         for c in fields:
             cap = tk.Label(content, text=c, font=FONT_MED, anchor="w", fg="#555", bg="white")
             cap.pack(fill="x", padx=pad, pady=(6, 0))
-            val = tk.Label(content, text=str(row[c]), font=FONT_MED,
+            val = tk.Label(content, text="", font=FONT_MED,
                            anchor="w", justify="left", wraplength=win_w - pad*2,
                            bg="white", fg="black")
             val.pack(fill="x", padx=pad)
@@ -850,24 +1021,21 @@ class App:
         )
         close_btn.grid(row=0, column=2, padx=(0,10), pady=(6,10), sticky="e")
 
+        win.withdraw()  # 表示は show_detail() で
         self.detail_win = win
-        self.update_detail_nav_buttons()
 
     def close_detail_if_exists(self):
+        # 破棄せず隠すだけ（次に開くときは中身の差し替えで済む）
         try:
             if self.detail_win is not None and self.detail_win.winfo_exists():
                 try:
                     self.detail_win.grab_release()
                 except Exception:
                     pass
-                self.detail_win.destroy()
+                self.detail_win.withdraw()
         except Exception:
             pass
-        self.detail_win = None
         self.detail_abs_index = None
-        self.detail_labels = {}
-        self.prev_btn = None
-        self.next_btn = None
     
     def print_detail(self):
         """
@@ -895,60 +1063,12 @@ class App:
     def _extract_detail_fields_for_print(self):
         """
         詳細表示中のレコードから「登録番号／メディア／タイトル」を抽出して返す。
-        いくつかの列名バリエーションに対応（安全に空文字フォールバック）。
+        列名のゆらぎは読み込み時に RecordLayout で解決済み（見つからない項目は空文字）。
         """
-        row = None
-
-        # よくある保持先を優先して探す（あなたの実装に合わせて広めにケア）
-        if hasattr(self, "detail_rows") and hasattr(self, "detail_index"):
-            try:
-                if 0 <= self.detail_index < len(self.detail_rows):
-                    row = self.detail_rows[self.detail_index]
-            except Exception:
-                pass
-
-        if row is None and hasattr(self, "current_detail_row"):
-            row = getattr(self, "current_detail_row")
-
-        if row is None and hasattr(self, "selected_rows") and getattr(self, "selected_rows"):
-            row = self.selected_rows[0]
-
-        # dict 化
-        if row is None:
-            data = {}
-        else:
-            try:
-                # pandas Series など
-                if hasattr(row, "to_dict"):
-                    data = row.to_dict()
-                elif isinstance(row, dict):
-                    data = row
-                else:
-                    # namedtuple / list の場合は不可知なので空
-                    data = {}
-            except Exception:
-                data = {}
-
-        def find_value(candidates):
-            """列名の候補（文字列配列）を走査して最初に見つかった値を返す"""
-            for key in list(data.keys()):
-                key_lower = str(key).lower()
-                for cand in candidates:
-                    if cand in key_lower:
-                        return data.get(key, "")
-            return ""
-
-        # 列名のゆらぎに対応
-        regno  = find_value(["登録番号", "請求番号", "登録", "請求", "catalog", "call", "id"])
-        media  = find_value(["メディア", "媒体", "format", "フォーマット"])
-        title  = find_value(["タイトル", "題名", "title", "表題"])
-
-        # str 化して返す
-        return {
-            "登録番号": str(regno or ""),
-            "メディア": str(media or ""),
-            "タイトル": str(title or "")
-        }
+        if self.detail_abs_index is None or self.engine is None:
+            return {label: "" for label in PRINT_FIELD_CANDIDATES}
+        row = self.detail_record(self.detail_abs_index)
+        return {label: row.get(col, "") for label, col in row.layout.print_cols.items()}
 
     def _open_receipt_preview(self, info: dict, seq_no: int):
         """
@@ -1036,33 +1156,33 @@ class App:
 
     # ==== ナビ（前/次ボタンでリストも連動しページ送り） ====
     def nav_detail(self, delta: int):
-        if self.detail_abs_index is None or self.df_hits is None:
+        if self.detail_abs_index is None or self.hit_rows is None:
             return
         new_idx = self.detail_abs_index + delta
-        if new_idx < 0 or new_idx >= len(self.df_hits):
+        if new_idx < 0 or new_idx >= len(self.hit_rows):
             return
 
         self.detail_abs_index = new_idx
-        row = self.df_hits.iloc[new_idx]
-        self.update_detail_labels(row)
+        self.update_detail_labels(self.detail_record(new_idx))
 
-        # ページ切替判定
-        new_page = (new_idx // PAGE_SIZE) + 1
-        if new_page != self.page:
-            self.page = new_page
-            self.update_table()
+        # 表示窓の外に出たらページ切替（連続スクロールでは1行ずつずらす）
+        if not (self.view_top <= new_idx < self.view_top + PAGE_SIZE):
+            if new_idx < self.view_top or not self.scroll_mode.get():
+                self._scroll_to(new_idx, now=True)
+            else:
+                self._scroll_to(new_idx - PAGE_SIZE + 1, now=True)
 
-        # Treeview選択同期
-        rel_idx = new_idx - (self.page - 1) * PAGE_SIZE
-        items = self.tree.get_children()
-        if 0 <= rel_idx < len(items):
-            item_id = items[rel_idx]
+        # Treeview選択同期（表示窓の rel_idx 行目＝使い回し行の rel_idx 番目）
+        rel_idx = new_idx - self.view_top
+        if 0 <= rel_idx < self.pool_shown:
+            item_id = self.tree_pool[rel_idx]
             self.tree.selection_set(item_id)
             self.tree.see(item_id)
 
         self.update_detail_nav_buttons()
+        self._prefetch_around(new_idx)
 
-    def update_detail_labels(self, row: pd.Series):
+    def update_detail_labels(self, row: Record):
         if not self.detail_labels:
             return
         if "タイトル" in self.detail_labels:
@@ -1070,8 +1190,10 @@ class App:
         for c, lbl in self.detail_labels.items():
             if c == "タイトル":
                 continue
-            if c in row.index:
+            if c in row:
                 lbl.config(text=str(row[c]))
+        if self.detail_canvas is not None:
+            self.detail_canvas.yview_moveto(0)
 
     def update_detail_nav_buttons(self):
         # prev
@@ -1082,91 +1204,43 @@ class App:
                 self.prev_btn.configure(state="normal")
         # next
         if self.next_btn:
-            if self.df_hits is None or self.detail_abs_index is None or self.detail_abs_index >= len(self.df_hits)-1:
+            if self.hit_rows is None or self.detail_abs_index is None or self.detail_abs_index >= len(self.hit_rows)-1:
                 self.next_btn.configure(state="disabled")
             else:
                 self.next_btn.configure(state="normal")
 
     # ==== ページ操作 ====
     def prev_page(self):
-        if self.df_hits is None: return
-        if self.page > 1:
-            self.page -= 1
-            self.update_table()
+        self._scroll_to(self.view_top - PAGE_SIZE, now=True)
 
     def next_page(self):
-        if self.df_hits is None: return
-        maxp = (len(self.df_hits) + PAGE_SIZE - 1) // PAGE_SIZE
-        if self.page < maxp:
-            self.page += 1
-            self.update_table()
+        self._scroll_to(self.view_top + PAGE_SIZE, now=True)
 
     def to_first(self):
-        if self.df_hits is None: return
-        self.page = 1
-        self.update_table()
+        self._scroll_to(0, now=True)
 
     def to_last(self):
-        if self.df_hits is None: return
-        self.page = (len(self.df_hits) + PAGE_SIZE - 1) // PAGE_SIZE
-        self.update_table()
+        if self.hit_rows is None: return
+        self._scroll_to(len(self.hit_rows), now=True)
 
     def run_advanced_search(self, dlg: tk.Toplevel):
-        """詳細検索の条件で self.df_all を絞り込み、結果を反映"""
-        df = self.df_all
-        mask = pd.Series([True]*len(df), index=df.index)
-
-        # 入力欄：部分一致（AND）
-        title_q = self.adv_entries.get("タイトル").get().strip()
-        person_q = self.adv_entries.get("人名").get().strip()
-        content_q = self.adv_entries.get("内容").get().strip()
-        callno_q = self.adv_entries.get("請求番号").get().strip()
-
-        if title_q:
-            mask &= df["タイトル"].fillna("").str.contains(re.escape(title_q), case=False)
-        if person_q:
-            # 人名は 演奏者/作曲者/出演者/監督 など複数列がある可能性に備えて幅広く見る
-            cols = [c for c in df.columns if any(k in c for k in ["演奏","作曲","出演","監督","人名","作者","著者","制作","製作","歌手","語り"])]
-            if not cols:
-                cols = ["演奏者","作曲者"]
-            per_mask = pd.Series([False]*len(df), index=df.index)
-            for c in cols:
-                if c in df.columns:
-                    per_mask |= df[c].fillna("").str.contains(re.escape(person_q), case=False)
-            mask &= per_mask
-        if content_q:
-            # 本文用の __全文__ があればそれを使う、なければ「解説」「内容」「備考」などをORで
-            if "__全文__" in df.columns:
-                mask &= df["__全文__"].fillna("").str.contains(re.escape(content_q), case=False)
-            else:
-                cols = [c for c in df.columns if any(k in c for k in ["解説","内容","備考","メモ","注記"])]
-                if cols:
-                    c_mask = pd.Series([False]*len(df), index=df.index)
-                    for c in cols:
-                        c_mask |= df[c].fillna("").str.contains(re.escape(content_q), case=False)
-                    mask &= c_mask
-        if callno_q:
-            # 請求番号/資料番号/所蔵番号などを幅広く
-            cols = [c for c in df.columns if any(k in c for k in ["請求","資料番号","所蔵番号","管理番号","ID","番号"])]
-            if not cols:
-                cols = ["請求番号"]
-            c_mask = pd.Series([False]*len(df), index=df.index)
-            for c in cols:
-                if c in df.columns:
-                    c_mask |= df[c].fillna("").str.contains(re.escape(callno_q), case=False)
-            mask &= c_mask
-
-        # メディア種別：チェックされているものだけ許可（OR）
+        """
+        詳細検索の条件で self.df_all を絞り込み、結果を反映。
+        各欄は読み込み時に作った連結・正規化済みの列を索引で1回引くだけ
+        （全角/半角・大文字/小文字・カタカナ/ひらがなの違いは無視）。
+        """
+        self._cancel_live_search()
+        conds = {}
+        for field in ["タイトル", "人名", "内容", "請求番号"]:
+            q = self.adv_entries.get(field).get().strip()
+            if q:
+                conds[field] = q
         checked = [k for k,v in self.adv_media_vars.items() if v.get()]
-        media_cols = [c for c in df.columns if any(k in c for k in ["メディア","媒体","種類","フォーマット","形態"])]
-        if checked and media_cols:
-            m_mask = pd.Series([False]*len(df), index=df.index)
-            for c in media_cols:
-                m_mask |= df[c].fillna("").str.contains("|".join(map(re.escape, checked)))
-            mask &= m_mask
-
-        self.df_hits = df[mask].copy()
-        self.cur_page = 0
+        t0 = time.perf_counter()
+        with self.metrics.span("advanced"):
+            self.hit_rows = self.engine.advanced(conds, checked)
+        self._log_query("advanced", len(self.hit_rows), t0, conds=conds, media=checked)
+        self.view_top = 0
         self.update_table()
         try:
             dlg.grab_release()
@@ -1174,6 +1248,63 @@ class App:
             pass
         dlg.destroy()
 
+    # ==== 検索ログ ====
+    def _log_query(self, kind: str, hits: int, t0: float = None, ms: float = None, **fields):
+        # 検索ログへ1件（キューに積むだけ。ファイルへは QueryLog のスレッドが書く）。所要時間は t0 からか ms
+        if self.query_log is None:
+            return
+        if ms is None:
+            ms = (time.perf_counter() - t0) * 1000.0
+        self.query_log.log(kind, hits=int(hits), ms=round(ms, 1), **fields)
+
+    def _on_root_destroy(self, event):
+        # メインウィンドウが閉じられたら（× でもエラー終了でも）検索を止め、ログ・計測を書き切る
+        if event.widget is not self.root:
+            return
+        self.live_seq += 1  # 実行中の検索は結果を捨てる
+        self.live_pool.shutdown(wait=False, cancel_futures=True)
+        if self.query_log is not None:
+            self.query_log.close()
+        if METRICS_FILE and self.metrics.enabled:
+            extra = {"query_cache": self.engine.cache.stats()} if self.engine is not None else None
+            self.metrics.dump(Path(__file__).resolve().parent / METRICS_FILE, extra)
+
+    # ==== 処理時間の表示（スタッフ用） ====
+    def _toggle_metrics_overlay(self, event=None):
+        if self.metrics_label is not None and self.metrics_label.winfo_ismapped():
+            self.metrics_label.place_forget()
+            if self.metrics_after_id is not None:
+                self.root.after_cancel(self.metrics_after_id)
+                self.metrics_after_id = None
+            return
+        if self.metrics_label is None:
+            self.metrics_label = tk.Label(self.root, font=("Consolas", 10), justify="left", anchor="nw",
+                                          bg="#222222", fg="#f0f0f0", padx=10, pady=8)
+        self.metrics_label.place(relx=1.0, x=-12, y=12, anchor="ne")
+        self.metrics_label.lift()
+        self._refresh_metrics_overlay()
+
+    def _metrics_text(self) -> str:
+        if not self.metrics.enabled:
+            return "処理時間の計測はオフです（search_core.METRICS）"
+        lines = [f"{'処理':<14}{'回数':>4}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)"]
+        for name, st in self.metrics.summary().items():
+            lines.append(f"{name:<16}{st['count']:>6}{st['p50']:>9.1f}{st['p95']:>9.1f}"
+                         f"{st['p99']:>9.1f}{st['max']:>9.1f}")
+        if self.engine is not None:
+            cs = self.engine.cache.stats()
+            lines.append(f"結果キャッシュ: ヒット {cs['hits']} / ミス {cs['misses']}（{cs['size']} 件保持）")
+        return "\n".join(lines)
+
+    def _refresh_metrics_overlay(self):
+        self.metrics_label.config(text=self._metrics_text())
+        self.metrics_after_id = self.root.after(METRICS_OVERLAY_MS, self._refresh_metrics_overlay)
+
+    def _dump_metrics(self):
+        extra = {"query_cache": self.engine.cache.stats()} if self.engine is not None else None
+        self.metrics.dump(Path(__file__).resolve().parent / METRICS_FILE, extra)
+        self.root.after(METRICS_DUMP_MS, self._dump_metrics)
+
     # ==== プレースホルダ ====
     def search_people(self): messagebox.showinfo("人名検索", "後で実装予定です。")
     def search_advanced(self): messagebox.showinfo("詳細検索", "後で実装予定です。")
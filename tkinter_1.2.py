@@ -4,8 +4,8 @@
 import sys
 import tkinter as tk
 from tkinter import ttk, messagebox
-import pandas as pd
-import re
+import queue
+import threading
 from pathlib import Path
 try:
     from PIL import Image, ImageTk
@@ -13,9 +13,20 @@ try:
 except Exception:
     PIL_OK = False
 
+from search_core import SearchEngine, RecordLayout, Record
+
 # ========= 設定 =========
-SHEET_NAME = "Sheet"
+# 読み込み・検索の設定（シート名・列の使い道・キャッシュなど）は search_core.py にある
+# 一覧表示の列（無ければ先頭7列）とキーワード検索の列（無ければ全列）はこの画面の指定を使う
+MAIN_COLS   = ["No.","登録番号","タイトル","作曲者","演奏者","ジャンル","メディア"]
+SEARCH_COLS = ["タイトル","作曲者","演奏者","演奏者（追加）","内容","内容（追加）",
+               "ジャンル","メディア","登録番号","レコード番号","レーベル",
+               "タイトル(カタカナ)","演奏者(カタカナ)"]
+
 PAGE_SIZE  = 10   # 検索結果は10行表示
+
+LOAD_POLL_MS = 50  # 読み込みスレッドの進捗を見に行く間隔（ミリ秒）
+
 FONT_TITLE = ("Meiryo", 28, "bold")
 FONT_SUB   = ("Meiryo", 18)
 FONT_LARGE = ("Meiryo", 20)
@@ -29,140 +40,158 @@ DETAIL_TOP_MARGIN = 20   # メインウィンドウ上端からのマージン(p
 FADE_IN_MS = 80          # フェードイン総時間（ミリ秒）←短くして目が疲れない程度
 FADE_STEP_MS = 10        # アニメの間隔（ミリ秒）
 
-# ========= データ読み込み =========
-def load_dataset(path: Path):
-    df = pd.read_excel(path, sheet_name=SHEET_NAME)
-    for c in df.columns:
-        df[c] = df[c].astype(str).fillna("")
-    pref_cols = [c for c in [
-        "タイトル","作曲者","演奏者","演奏者（追加）","内容","内容（追加）",
-        "ジャンル","メディア","登録番号","レコード番号","レーベル",
-        "タイトル(カタカナ)","演奏者(カタカナ)"
-    ] if c in df.columns]
-    if not pref_cols:
-        pref_cols = list(df.columns)
-    df["__全文__"] = df[pref_cols].agg("　".join, axis=1)
-    main_cols = [c for c in ["No.","登録番号","タイトル","作曲者","演奏者","ジャンル","メディア"] if c in df.columns]
-    if not main_cols:
-        main_cols = list(df.columns)[:7]
-    return df, main_cols
-
-def keyword_mask(df, q: str):
-    if not q.strip():
-        return pd.Series([True]*len(df), index=df.index)
-    parts = [p for p in re.split(r"\s+", q.strip()) if p]
-    mask = pd.Series([True]*len(df), index=df.index)
-    for p in parts:
-        mask = mask & df["__全文__"].str.contains(p, case=False, na=False)
-    return mask
-
 # ========= 詳細表示（右側・スクロール・高速フェードイン） =========
-def show_detail_right_fade(row: pd.Series, parent: tk.Tk):
-    # --- 親ウィンドウのジオメトリから位置とサイズを算出 ---
-    parent.update_idletasks()
-    px = parent.winfo_rootx()
-    py = parent.winfo_rooty()
-    pw = parent.winfo_width()
-    ph = parent.winfo_height()
-
-    win_w = max(480, int(pw * DETAIL_WIDTH_PCT))
-    win_h = max(300, int(ph * DETAIL_HEIGHT_PCT))
-    # 右側いっぱい（右半分）：左上を右端側に寄せる
-    x = px + pw - win_w
-    y = py + DETAIL_TOP_MARGIN
-
-    # --- Toplevel（最初は透明→フェードイン） ---
-    win = tk.Toplevel(parent)
-    win.title("詳細表示")
-    win.geometry(f"{win_w}x{win_h}+{x}+{y}")
-    win.resizable(True, True)
-    try:
-        win.attributes("-alpha", 0.0)
-    except Exception:
-        pass
-
-    # --- スクロール可能領域（Canvas + 内部Frame） ---
-    container = tk.Frame(win)
-    container.pack(fill="both", expand=True)
-
-    canvas = tk.Canvas(container, highlightthickness=0)
-    vbar = ttk.Scrollbar(container, orient="vertical", command=canvas.yview)
-    canvas.configure(yscrollcommand=vbar.set)
-    canvas.pack(side="left", fill="both", expand=True)
-    vbar.pack(side="right", fill="y")
-
-    inner = tk.Frame(canvas)
-    inner_id = canvas.create_window((0, 0), window=inner, anchor="nw")
-
-    def _on_configure(event=None):
-        canvas.configure(scrollregion=canvas.bbox("all"))
-        canvas.itemconfigure(inner_id, width=canvas.winfo_width())
-    inner.bind("<Configure>", _on_configure)
-
-    # --- マウスホイール／トラックパッド対応（Win/Linux/macOS） ---
-    def _on_mousewheel_windows(event):
-        # Windows: event.delta は ±120 の倍数
-        canvas.yview_scroll(-int(event.delta / 120), "units")
-
-    def _on_mousewheel_darwin(event):
-        # macOS: 小さい ±値（トラックパッド）、なめらかスクロール
-        direction = -1 if event.delta > 0 else 1
-        canvas.yview_scroll(direction, "units")
-
-    def _on_mousewheel_linux_up(event):
-        canvas.yview_scroll(-1, "units")
-
-    def _on_mousewheel_linux_down(event):
-        canvas.yview_scroll(1, "units")
-
-    if sys.platform.startswith("win"):
-        canvas.bind("<MouseWheel>", _on_mousewheel_windows)
-        inner.bind("<MouseWheel>", _on_mousewheel_windows)
-    elif sys.platform == "darwin":
-        canvas.bind("<MouseWheel>", _on_mousewheel_darwin)
-        inner.bind("<MouseWheel>", _on_mousewheel_darwin)
-    else:
-        # X11 (Linux)
-        canvas.bind("<Button-4>", _on_mousewheel_linux_up)
-        canvas.bind("<Button-5>", _on_mousewheel_linux_down)
-        inner.bind("<Button-4>", _on_mousewheel_linux_up)
-        inner.bind("<Button-5>", _on_mousewheel_linux_down)
-
-    # --- 中身（主要項目のみ、全フィールドは出さない） ---
-    title_txt = row.get("タイトル", "") if "タイトル" in row.index else ""
-    header = tk.Label(inner, text=title_txt, font=("Meiryo", 20, "bold"),
-                      anchor="w", wraplength=DETAIL_WRAP, justify="left")
-    header.pack(fill="x", padx=14, pady=(10, 6))
-
-    sub_fields = [c for c in ["作曲者","演奏者","演奏者（追加）","ジャンル","メディア",
-                              "登録番号","レコード番号","レーベル","内容","内容（追加）"]
-                  if c in row.index]
-    for c in sub_fields:
-        cap = tk.Label(inner, text=c, font=FONT_MED, anchor="w", fg="#555")
-        cap.pack(fill="x", padx=14, pady=(8, 0))
-        val = tk.Label(inner, text=str(row[c]), font=FONT_MED, anchor="w",
-                       wraplength=DETAIL_WRAP, justify="left")
-        val.pack(fill="x", padx=14)
-
-    # 末尾に少し余白
-    tk.Frame(inner, height=10).pack()
-
-    # --- フェードイン（80ms でスッと） ---
-    try:
-        steps = max(1, FADE_IN_MS // FADE_STEP_MS)
-        def _fade(step=0):
-            a = min(1.0, (step + 1) / steps)
-            try:
-                win.attributes("-alpha", a)
-            except Exception:
-                pass
-            if step + 1 < steps:
-                win.after(FADE_STEP_MS, _fade, step + 1)
-        _fade(0)
-    except Exception:
-        pass
+DETAIL_FIELDS = ["作曲者","演奏者","演奏者（追加）","ジャンル","メディア",
+                 "登録番号","レコード番号","レーベル","内容","内容（追加）"]
+
+class DetailPane:
+    """
+    右側の詳細表示。ウィンドウとラベルは最初に開いたときに1回だけ作り、
+    以降は中身の差し替えと表示/非表示（withdraw）だけで済ませる。
+    """
+    def __init__(self, parent: tk.Tk):
+        self.parent = parent
+        self.win = None
+        self.canvas = None
+        self.header = None
+        self.values = {}  # 列名 → 値ラベル
+
+    def is_open(self) -> bool:
+        try:
+            return self.win is not None and self.win.winfo_exists() and self.win.state() != "withdrawn"
+        except Exception:
+            return False
+
+    def _place(self):
+        # --- 親ウィンドウのジオメトリから位置とサイズを算出 ---
+        parent = self.parent
+        parent.update_idletasks()
+        px = parent.winfo_rootx()
+        py = parent.winfo_rooty()
+        pw = parent.winfo_width()
+        ph = parent.winfo_height()
+
+        win_w = max(480, int(pw * DETAIL_WIDTH_PCT))
+        win_h = max(300, int(ph * DETAIL_HEIGHT_PCT))
+        # 右側いっぱい（右半分）：左上を右端側に寄せる
+        x = px + pw - win_w
+        y = py + DETAIL_TOP_MARGIN
+        self.win.geometry(f"{win_w}x{win_h}+{x}+{y}")
+
+    def _build(self, columns):
+        # --- Toplevel（× で閉じても破棄せず隠すだけ） ---
+        win = tk.Toplevel(self.parent)
+        win.title("詳細表示")
+        win.resizable(True, True)
+        win.protocol("WM_DELETE_WINDOW", self.hide)
+        win.withdraw()
+        self.win = win
+
+        # --- スクロール可能領域（Canvas + 内部Frame） ---
+        container = tk.Frame(win)
+        container.pack(fill="both", expand=True)
+
+        canvas = tk.Canvas(container, highlightthickness=0)
+        vbar = ttk.Scrollbar(container, orient="vertical", command=canvas.yview)
+        canvas.configure(yscrollcommand=vbar.set)
+        canvas.pack(side="left", fill="both", expand=True)
+        vbar.pack(side="right", fill="y")
+        self.canvas = canvas
+
+        inner = tk.Frame(canvas)
+        inner_id = canvas.create_window((0, 0), window=inner, anchor="nw")
+
+        def _on_configure(event=None):
+            canvas.configure(scrollregion=canvas.bbox("all"))
+            canvas.itemconfigure(inner_id, width=canvas.winfo_width())
+        inner.bind("<Configure>", _on_configure)
+
+        # --- マウスホイール／トラックパッド対応（Win/Linux/macOS） ---
+        def _on_mousewheel_windows(event):
+            # Windows: event.delta は ±120 の倍数
+            canvas.yview_scroll(-int(event.delta / 120), "units")
+
+        def _on_mousewheel_darwin(event):
+            # macOS: 小さい ±値（トラックパッド）、なめらかスクロール
+            direction = -1 if event.delta > 0 else 1
+            canvas.yview_scroll(direction, "units")
+
+        def _on_mousewheel_linux_up(event):
+            canvas.yview_scroll(-1, "units")
+
+        def _on_mousewheel_linux_down(event):
+            canvas.yview_scroll(1, "units")
+
+        if sys.platform.startswith("win"):
+            canvas.bind("<MouseWheel>", _on_mousewheel_windows)
+            inner.bind("<MouseWheel>", _on_mousewheel_windows)
+        elif sys.platform == "darwin":
+            canvas.bind("<MouseWheel>", _on_mousewheel_darwin)
+            inner.bind("<MouseWheel>", _on_mousewheel_darwin)
+        else:
+            # X11 (Linux)
+            canvas.bind("<Button-4>", _on_mousewheel_linux_up)
+            canvas.bind("<Button-5>", _on_mousewheel_linux_down)
+            inner.bind("<Button-4>", _on_mousewheel_linux_up)
+            inner.bind("<Button-5>", _on_mousewheel_linux_down)
+
+        # --- 中身（主要項目のみ、全フィールドは出さない）。値は show() で差し替える ---
+        self.header = tk.Label(inner, text="", font=("Meiryo", 20, "bold"),
+                               anchor="w", wraplength=DETAIL_WRAP, justify="left")
+        self.header.pack(fill="x", padx=14, pady=(10, 6))
+
+        self.values = {}
+        for c in [c for c in DETAIL_FIELDS if c in columns]:
+            cap = tk.Label(inner, text=c, font=FONT_MED, anchor="w", fg="#555")
+            cap.pack(fill="x", padx=14, pady=(8, 0))
+            val = tk.Label(inner, text="", font=FONT_MED, anchor="w",
+                           wraplength=DETAIL_WRAP, justify="left")
+            val.pack(fill="x", padx=14)
+            self.values[c] = val
+
+        # 末尾に少し余白
+        tk.Frame(inner, height=10).pack()
+
+    def show(self, row: Record):
+        if self.win is None or not self.win.winfo_exists():
+            self._build(row.keys())
+        self.header.config(text=row.get("タイトル", ""))
+        for c, lbl in self.values.items():
+            lbl.config(text=row.get(c, ""))
+        self.canvas.yview_moveto(0)
+        if self.is_open():
+            return  # 表示中は中身の差し替えだけ
+        self._place()
+        try:
+            self.win.attributes("-alpha", 0.0)
+        except Exception:
+            pass
+        self.win.deiconify()
+        self._fade_in()
 
-    return win
+    def hide(self):
+        try:
+            if self.win is not None and self.win.winfo_exists():
+                self.win.withdraw()
+        except Exception:
+            pass
+
+    def _fade_in(self):
+        # --- フェードイン（80ms でスッと） ---
+        win = self.win
+        try:
+            steps = max(1, FADE_IN_MS // FADE_STEP_MS)
+            def _fade(step=0):
+                a = min(1.0, (step + 1) / steps)
+                try:
+                    win.attributes("-alpha", a)
+                except Exception:
+                    pass
+                if step + 1 < steps:
+                    win.after(FADE_STEP_MS, _fade, step + 1)
+            _fade(0)
+        except Exception:
+            pass
 
 # ========= メインアプリ =========
 class App:
@@ -193,16 +222,27 @@ class App:
         tk.Label(title_frame, text="広島市映像文化ライブラリー", font=FONT_TITLE, anchor="w").pack(anchor="w")
         tk.Label(title_frame, text="館内閲覧資料　検索データベース　[ベータ版 v1.1]", font=FONT_SUB, anchor="w").pack(anchor="w")
 
+        # 読み込み中表示（読み込みが終わったら消す）
+        self.loading_frame = tk.Frame(header)
+        self.loading_frame.pack(side="left", padx=(40, 0))
+        self.label_loading = tk.Label(self.loading_frame, text="データ読み込み中…", font=FONT_MED, fg="#555")
+        self.label_loading.pack(anchor="w")
+        self.loading_bar = ttk.Progressbar(self.loading_frame, mode="indeterminate", length=240)
+        self.loading_bar.pack(anchor="w", pady=(4, 0))
+        self.loading_bar.start(15)
+
         # ==== キーワード検索 ====
         search_frame = tk.Frame(self.root)
         search_frame.pack(pady=(20, 10))
         tk.Label(search_frame, text="キーワード検索", font=FONT_LARGE).pack(anchor="center")
         entry_row = tk.Frame(search_frame)
         entry_row.pack(pady=10)
-        self.entry = tk.Entry(entry_row, width=40, font=FONT_LARGE)
+        # データが揃うまでは入力・検索できないようにしておく
+        self.entry = tk.Entry(entry_row, width=40, font=FONT_LARGE, state="disabled")
         self.entry.pack(side="left", padx=(0,12), ipady=12)
-        btn_search = tk.Button(entry_row, text="検索", font=FONT_LARGE, command=self.do_search)
-        btn_search.pack(side="left")
+        self.btn_search = tk.Button(entry_row, text="検索", font=FONT_LARGE, command=self.do_search,
+                                    state="disabled")
+        self.btn_search.pack(side="left")
         self.entry.bind("<Return>", lambda e: self.do_search())
 
         # ==== ボタン群（左寄せ） ====
@@ -242,14 +282,50 @@ class App:
                           relief="groove", borderwidth=2, width=8)
             b.pack(side="left", padx=8, pady=10)
 
-        # ==== データ ====
+        self.engine = None       # 検索エンジン（search_core.SearchEngine。読み込み完了で作成）
+        self.detail_layout = None  # 詳細表示の列（シートの全列）
+        self.main_cols = []
+        self.hit_rows = None     # 検索結果（行位置。関連度順）
+        self.page = 1
+        self.detail = DetailPane(self.root)  # 右側詳細を一枚に保つ（使い回し）
+
+        # ==== データ（別スレッドで読み込み、結果は after で Tk スレッドへ受け渡す） ====
         excel_path = Path(__file__).resolve().parent / "all_data.xlsx"
+        self.load_queue = queue.Queue()
+        threading.Thread(target=self._load_worker, args=(excel_path,), daemon=True).start()
+        self.root.after(LOAD_POLL_MS, self._poll_loader)
+
+    # ==== データ読み込み（別スレッド） ====
+    def _load_worker(self, excel_path: Path):
+        # ここでは Tk を触らない（結果はすべてキュー経由）
+        post = self.load_queue.put
         try:
-            self.df_all, self.main_cols = load_dataset(excel_path)
+            post(("dataset", SearchEngine.load(excel_path, progress=lambda msg: post(("progress", msg)),
+                                              main_cols=MAIN_COLS, search_cols=SEARCH_COLS)))
         except Exception as e:
-            messagebox.showerror("エラー", f"Excel 読み込み失敗: {e}")
-            self.root.destroy()
-            return
+            post(("error", e))
+
+    def _poll_loader(self):
+        try:
+            while True:
+                kind, value = self.load_queue.get_nowait()
+                if kind == "progress":
+                    self.label_loading.config(text=f"{value}…")
+                elif kind == "dataset":
+                    self._on_dataset_loaded(value)
+                    return
+                elif kind == "error":
+                    messagebox.showerror("エラー", f"Excel 読み込み失敗: {value}")
+                    self.root.destroy()
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(LOAD_POLL_MS, self._poll_loader)
+
+    def _on_dataset_loaded(self, engine: SearchEngine):
+        self.engine = engine
+        self.main_cols = engine.main_cols
+        self.detail_layout = RecordLayout(engine.df, engine.public_columns)
 
         cols_ids = [f"c{i+1}" for i in range(len(self.main_cols))]
         self.tree.configure(columns=cols_ids)
@@ -257,15 +333,18 @@ class App:
             self.tree.heading(cols_ids[i], text=c)
             self.tree.column(cols_ids[i], width=200, anchor="w")
 
-        self.df_hits = None
-        self.page = 1
-        self.detail_win = None  # 右側詳細を一枚に保つ
+        self.loading_bar.stop()
+        self.loading_frame.pack_forget()
+        self.entry.configure(state="normal")
+        self.btn_search.configure(state="normal")
+        self.entry.focus_set()
 
     # ==== 検索処理 ====
     def do_search(self):
+        if self.engine is None:
+            return
         q = self.entry.get()
-        mask = keyword_mask(self.df_all, q)
-        self.df_hits = self.df_all[mask].copy()
+        self.hit_rows = self.engine.rank(q, self.engine.search(q))
         self.page = 1
         self.update_table()
 
@@ -274,18 +353,17 @@ class App:
         for r in self.tree.get_children():
             self.tree.delete(r)
 
-        if self.df_hits is None or self.df_hits.empty:
+        if self.hit_rows is None or len(self.hit_rows) == 0:
             self.label_count.config(text="ヒット件数: 0")
             self.table_area.pack_forget()
             self.nav.pack_forget()
             return
 
-        total = len(self.df_hits)
+        total = len(self.hit_rows)
         start = (self.page - 1) * PAGE_SIZE
         end   = min(start + PAGE_SIZE, total)
-        view = self.df_hits.iloc[start:end]
 
-        rows = view[self.main_cols].astype(str).values.tolist()
+        rows = self.engine.fetch_page(self.hit_rows, start, end)
         for i, vals in enumerate(rows):
             tag = "odd" if i % 2 else "even"
             self.tree.insert("", "end", values=vals, tags=(tag,))
@@ -299,45 +377,40 @@ class App:
         self.nav.pack(anchor="w", padx=50, pady=5)
 
     def on_row_double_click(self, event):
-        if self.df_hits is None or self.df_hits.empty:
+        if self.hit_rows is None or len(self.hit_rows) == 0:
             return
         sel = self.tree.selection()
         if not sel: return
         item_id = sel[0]
         idx_in_page = self.tree.index(item_id)
         start = (self.page - 1) * PAGE_SIZE
-        row = self.df_hits.iloc[start + idx_in_page]
+        row = self.engine.fetch_record(self.hit_rows[start + idx_in_page], self.detail_layout)
 
-        # 既存の詳細があれば閉じる（常に右側に1枚だけ）
-        try:
-            if self.detail_win is not None and self.detail_win.winfo_exists():
-                self.detail_win.destroy()
-        except Exception:
-            pass
-        self.detail_win = show_detail_right_fade(row, self.root)
+        # 詳細は常に右側に1枚だけ（開いていれば中身を差し替える）
+        self.detail.show(row)
 
     # ==== ページ操作 ====
     def prev_page(self):
-        if self.df_hits is None: return
+        if self.hit_rows is None: return
         if self.page > 1:
             self.page -= 1
             self.update_table()
 
     def next_page(self):
-        if self.df_hits is None: return
-        maxp = (len(self.df_hits) + PAGE_SIZE - 1) // PAGE_SIZE
+        if self.hit_rows is None: return
+        maxp = (len(self.hit_rows) + PAGE_SIZE - 1) // PAGE_SIZE
         if self.page < maxp:
             self.page += 1
             self.update_table()
 
     def to_first(self):
-        if self.df_hits is None: return
+        if self.hit_rows is None: return
         self.page = 1
         self.update_table()
 
     def to_last(self):
-        if self.df_hits is None: return
-        self.page = (len(self.df_hits) + PAGE_SIZE - 1) // PAGE_SIZE
+        if self.hit_rows is None: return
+        self.page = (len(self.hit_rows) + PAGE_SIZE - 1) // PAGE_SIZE
         self.update_table()
 
     # ==== 追加ボタンのプレースホルダ ====